@@ -19,7 +19,8 @@ class CNN_Text(nn.Module):
 
         self.embed = nn.Embedding(V, D)
         # self.convs1 = [nn.Conv2d(Ci, Co, (K, D)) for K in Ks]
-        self.convs1 = nn.ModuleList([nn.Conv2d(Ci, Co, (K, D)) for K in Ks])
+        # the (K, D) Conv2d as a Conv1d over the D channels of the words
+        self.convs1 = nn.ModuleList([nn.Conv1d(Ci * D, Co, K) for K in Ks])
         '''
         self.conv13 = nn.Conv2d(Ci, Co, (3, D))
         self.conv14 = nn.Conv2d(Ci, Co, (4, D))
@@ -28,9 +29,19 @@ class CNN_Text(nn.Module):
         self.dropout = nn.Dropout(args.dropout)
         self.fc1 = nn.Linear(len(Ks)*Co, C)
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # snapshots saved with the (Co, Ci, K, D) weights of Conv2d kernels
+        for i in range(len(self.convs1)):
+            key = '{}convs1.{}.weight'.format(prefix, i)
+            if key in state_dict and state_dict[key].dim() == 4:
+                Co, Ci, K, D = state_dict[key].shape
+                state_dict[key] = state_dict[key].permute(0, 1, 3, 2).reshape(
+                    Co, Ci * D, K)
+        super(CNN_Text, self)._load_from_state_dict(
+            state_dict, prefix, *args, **kwargs)
+
     def conv_and_pool(self, x, conv):
-        x = F.relu(conv(x)).squeeze(3)  # (N, Co, W)
-        x = F.max_pool1d(x, x.size(2)).squeeze(2)
+        x = F.relu(conv(x).amax(2))  # (N, Co)
         return x
 
     def forward(self, x):
@@ -39,11 +50,10 @@ class CNN_Text(nn.Module):
         if self.args.static:
             x = Variable(x)
 
-        x = x.unsqueeze(1)  # (N, Ci, W, D)
-
-        x = [F.relu(conv(x)).squeeze(3) for conv in self.convs1]  # [(N, Co, W), ...]*len(Ks)
+        x = x.transpose(1, 2)  # (N, D, W)
 
-        x = [F.max_pool1d(i, i.size(2)).squeeze(2) for i in x]  # [(N, Co), ...]*len(Ks)
+        # max over time before the relu, which is monotonic
+        x = [F.relu(conv(x).amax(2)) for conv in self.convs1]  # [(N, Co), ...]*len(Ks)
 
         x = torch.cat(x, 1)
 
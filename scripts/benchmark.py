@@ -0,0 +1,481 @@
+"""
+Microbenchmarks of the training pipeline.
+Usage: python3 -m scripts.benchmark <benchmark> [options]
+"""
+import argparse
+import copy
+import multiprocessing
+import resource
+import sys
+import timeit
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from google.protobuf import text_format
+from classifier.model import CNN_Text
+from scripts.train_model import loadParams
+from src.execution import configureCpu, configureDevice
+from src.discriminator import Cnn
+from src.generate_batches import batchToIds, batchesFromFiles, noise, \
+    noiseIds, preprocessSentences, readStyleFile
+from src.beam_search import BeamSearchDecoder
+from src.decoder import BOTH, MODES
+from src.greedy_decoding import GreedyDecoder
+from src.style_transfer import StyleTransfer
+from src.vocabulary import Vocabulary
+
+
+def report(name, seconds, repeat):
+    print("{0:<40} {1:10.3f} ms/batch".format(name, 1000 * seconds / repeat))
+
+
+def checkDifference(name, difference, atol):
+    """
+    Exit with an error if two implementations differ by more than atol
+    """
+    print("{0} max difference {1:.2e}".format(name, difference))
+    if not difference <= atol:
+        sys.exit("{0} differs by {1:.2e} > {2:.2e}".format(
+            name, difference, atol))
+
+
+def benchmarkNoise(args):
+    sentences = readStyleFile(args.file)[:args.batch_size]
+    sentences = [x.split(" ") for x in sentences]
+    lengths = np.array(list(map(len, sentences)))
+    ids = np.zeros((len(sentences), lengths.max()), dtype=np.int64)
+    for i, sent in enumerate(sentences):
+        ids[i, :len(sent)] = np.arange(len(sent)) + 4
+
+    loop = timeit.timeit(
+        lambda: noise(copy.deepcopy(sentences), args.word_drop),
+        number=args.repeat)
+    vectorized = timeit.timeit(
+        lambda: noiseIds(ids, lengths, args.word_drop),
+        number=args.repeat)
+    report("noise (python loop)", loop, args.repeat)
+    report("noiseIds (vectorized)", vectorized, args.repeat)
+    print("speedup: {0:.1f}x".format(loop / vectorized))
+
+
+def benchmarkPreprocess(args):
+    sentences = readStyleFile(args.file)[:args.batch_size]
+    vocab = Vocabulary()
+    vocab.loadVocabulary(args.vocabulary)
+
+    def listsOfTokens():
+        tokens = [x.split(" ") for x in sentences]
+        encoder_inputs, generator_inputs, targets, _ = preprocessSentences(
+            tokens, noisy=True, word_drop=args.word_drop)
+        return [
+            torch.stack(list(map(vocab.getSentenceIds, x)))
+            for x in [encoder_inputs, generator_inputs, targets]]
+
+    def singleBuffer():
+        ids, lengths = batchToIds(
+            sentences, vocab.word2id, noisy=True, word_drop=args.word_drop)
+        return torch.from_numpy(ids), torch.from_numpy(lengths)
+
+    old = timeit.timeit(listsOfTokens, number=args.repeat)
+    new = timeit.timeit(singleBuffer, number=args.repeat)
+    report("preprocessSentences + getSentenceIds", old, args.repeat)
+    report("batchToIds", new, args.repeat)
+    print("speedup: {0:.1f}x".format(old / new))
+
+
+def loadModel(args, variant):
+    """
+    Build a StyleTransfer from resources/params.asciipb, whose parameters
+    are overridden by variant, a string in protobuf text format
+    """
+    params = loadParams()
+    text_format.Merge(variant, params)
+    configureCpu(params.cpu)
+    configureDevice(params.device)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    vocab = Vocabulary()
+    vocab.loadVocabulary(args.vocabulary)
+    vocab.initializeEmbeddings(params.embedding_size)
+    return StyleTransfer(params, vocab), params
+
+
+def benchmarkTrain(args):
+    for variant in args.variants:
+        model, params = loadModel(args, variant)
+        batches = batchesFromFiles(
+            args.file_style1, args.file_style2, params.batch_size, True,
+            bucketSize=params.bucket_size)
+        if not isinstance(batches, list):
+            batches.shuffle()
+        batches = [batches[i] for i in range(args.warmup + args.batches)]
+        losses = []
+        reconstruction = []
+        for index, (inputs, labels) in enumerate(batches):
+            if index == args.warmup:
+                start = time.perf_counter()
+            loss = model.trainOnBatch(inputs, labels, index + 1)
+            losses.append(loss.item())
+            reconstruction.append(model.losses['reconstruction'].item())
+        seconds = time.perf_counter() - start
+        print("{0}\n    {1:10.1f} sentences/s, mean loss {2:.4f}, "
+              "mean reconstruction loss {3:.4f}".format(
+                  variant or "baseline",
+                  args.batches * params.batch_size / seconds,
+                  np.mean(losses[args.warmup:]),
+                  np.mean(reconstruction[args.warmup:])))
+
+
+def trainPeakMemory(args, variant):
+    """
+    Train on a few batches in a fresh process, returning the peak resident
+    memory (MB) after loading the model and after training, the peak GPU
+    memory allocated by training and the throughput
+    """
+    model, params = loadModel(args, variant)
+    batches = batchesFromFiles(
+        args.file_style1, args.file_style2, params.batch_size, True)
+    batches = batches[:args.batches]
+    # ru_maxrss is in KB on Linux
+    loaded = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    for index, (inputs, labels) in enumerate(batches):
+        model.trainOnBatch(inputs, labels, index + 1)
+    seconds = time.perf_counter() - start
+    trained = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    gpu = torch.cuda.max_memory_allocated() / 2**20 \
+        if torch.cuda.is_available() else 0
+    return loaded, trained, gpu, len(batches) * params.batch_size / seconds
+
+
+def benchmarkMemory(args):
+    # the peak memory of a process can not be reset,
+    # so every variant is trained by a new process
+    context = multiprocessing.get_context("spawn")
+    for variant in args.variants:
+        with context.Pool(1) as pool:
+            loaded, trained, gpu, throughput = pool.apply(
+                trainPeakMemory, (args, variant))
+        print("{0}\n    peak RSS {1:8.0f} MB, {2:8.0f} MB more than the "
+              "loaded model, peak GPU {3:8.0f} MB, {4:6.1f} "
+              "sentences/s".format(
+                  variant or "baseline", trained, trained - loaded, gpu,
+                  throughput))
+
+
+def benchmarkThreads(args):
+    model, params = loadModel(args, args.variant)
+    batches = batchesFromFiles(
+        args.file_style1, args.file_style2, params.batch_size, True)
+    batches = batches[:args.batches + 1]
+    greedy = GreedyDecoder(model, params)
+    for numThreads in args.threads:
+        torch.set_num_threads(numThreads)
+        timings = {}
+        for name, step in [
+                ("train", lambda x, i: model.trainOnBatch(x[0], x[1], i)),
+                ("greedy", lambda x, i: greedy.rewriteBatch(x[0], x[1]))]:
+            # the first batch is a warmup
+            step(batches[0], 1)
+            start = time.perf_counter()
+            for index, batch in enumerate(batches[1:]):
+                step(batch, index + 2)
+            timings[name] = args.batches * params.batch_size / (
+                time.perf_counter() - start)
+        print("threads {0:3d}: train {1:8.1f} sentences/s, "
+              "greedy rewrite {2:8.1f} sentences/s".format(
+                  numThreads, timings["train"], timings["greedy"]))
+
+
+def benchmarkDecode(args):
+    model, params = loadModel(args, "")
+    inputs, labels = batchesFromFiles(
+        args.file_style1, args.file_style2, params.batch_size, True)[0]
+    model.train()
+
+    def generate(soft):
+        # the same random numbers for every implementation
+        torch.manual_seed(0)
+        model.zero_grad()
+        encoder_inputs, generator_inputs, _, lengths = \
+            model._sentencesToInputs(inputs, noisy=False)
+        model.eval_size = len(inputs)
+        model._computeHiddens(
+            encoder_inputs, generator_inputs, labels, lengths, True)
+        hiddens, tokens = model._generateWithPrevOutput(
+            model.transformedHiddens, params.max_len, soft=soft)
+        outputs = [hiddens.detach(), tokens.detach()]
+        if soft:
+            (hiddens.sum() + tokens.sum()).backward()
+            outputs.extend(
+                parameter.grad.clone() for parameter in model.parameters()
+                if parameter.grad is not None)
+        return outputs
+
+    # let torch.compile draw the same random numbers of eager mode, so that
+    # its outputs can be compared with the nn.GRU loop
+    torch._inductor.config.fallback_random = True
+    reference = {}
+    for loop in args.loops:
+        params.decode_loop = loop
+        for soft in [True, False]:
+            # the first call compiles the loop
+            outputs = generate(soft)
+            seconds = timeit.timeit(lambda: generate(soft), number=args.repeat)
+            reference.setdefault(soft, outputs)
+            difference = max(
+                float((x.float() - y.float()).abs().max())
+                for x, y in zip(outputs, reference[soft]))
+            name = "{0} {1}".format(
+                loop or "nn.GRU", "soft + backward" if soft else "greedy")
+            report(name, seconds, args.repeat)
+            checkDifference(name, difference, args.atol)
+
+
+def benchmarkBeam(args):
+    model, params = loadModel(args, args.variant)
+    if args.model:
+        # an untrained model never generates <eos>
+        model.load(args.model)
+    batches = batchesFromFiles(
+        args.file_style1, args.file_style2, params.batch_size, True)
+    batches = batches[:args.batches + 1]
+    for width in args.widths:
+        params.beam_width = width
+        beam = BeamSearchDecoder(model, params)
+        with torch.inference_mode():
+            # the first batch is a warmup
+            beam.rewriteBatch(*batches[0], mode=args.mode)
+            words, rewrittenSentences = 0, 0
+            start = time.perf_counter()
+            for sentences, labels in batches[1:]:
+                for rewritten in beam.rewriteBatch(
+                        sentences, labels, mode=args.mode):
+                    if rewritten is not None:
+                        words += sum(len(x.split()) for x in rewritten)
+                        rewrittenSentences += len(rewritten)
+        seconds = time.perf_counter() - start
+        print("width {0:3d}: beam rewrite {1:8.1f} sentences/s, "
+              "{2:.1f} words per sentence".format(
+                  width, args.batches * params.batch_size / seconds,
+                  words / rewrittenSentences))
+
+
+def conv2dPooling(convs, x, activation):
+    """
+    The former Conv2d text convolutions with max-over-time pooling,
+    with the weights of the Conv1d convs
+    x -- (batch_size, seq_len, channels)
+    """
+    x = x.unsqueeze(1)
+    pooled = []
+    for conv in convs:
+        weight = conv.weight.transpose(1, 2).unsqueeze(1)
+        y = activation(F.conv2d(x, weight, conv.bias)).squeeze(3)
+        pooled.append(F.max_pool1d(y, y.size(2)).squeeze(2))
+    return torch.cat(pooled, 1)
+
+
+def benchmarkConvolutions(args):
+    params = loadParams()
+    configureCpu(params.cpu)
+    torch.manual_seed(0)
+
+    # update of a discriminator on the real and fake hidden states of
+    # a batch
+    cnn = Cnn(
+        params.discriminator.in_channels,
+        params.discriminator.out_channels,
+        params.discriminator.kernel_sizes,
+        params.autoencoder.hidden_size,
+        params.discriminator.dropout)
+    optimizer = torch.optim.Adam(cnn.parameters())
+    hiddens = torch.randn(
+        params.batch_size, params.max_len + 1,
+        params.autoencoder.hidden_size)
+    targets = torch.randint(0, 2, (params.batch_size, 1)).float()
+
+    def legacyDiscriminator(x):
+        x = conv2dPooling(
+            cnn.convs, x, lambda y: F.leaky_relu(y, negative_slope=0.01))
+        return cnn.linear(cnn.dropoutLayer(x))
+
+    def discriminatorUpdate(forward, bf16):
+        optimizer.zero_grad()
+        with torch.autocast(
+                device_type="cpu", dtype=torch.bfloat16, enabled=bf16):
+            logits = forward(hiddens)
+        loss = F.binary_cross_entropy_with_logits(logits.float(), targets)
+        loss.backward()
+        optimizer.step()
+
+    # inference of the classifier with the defaults of classifier/main.py
+    classifier = CNN_Text(argparse.Namespace(
+        embed_num=args.embed_num, embed_dim=200, class_num=2,
+        kernel_num=128, kernel_sizes=[1, 2, 3], dropout=0.5, static=False))
+    classifier.eval()
+    words = torch.randint(
+        0, args.embed_num, (args.classifier_batch_size, params.max_len))
+
+    def legacyClassifier(x):
+        x = conv2dPooling(classifier.convs1, classifier.embed(x), F.relu)
+        return classifier.fc1(x)
+
+    def classify(forward, bf16):
+        with torch.no_grad(), torch.autocast(
+                device_type="cpu", dtype=torch.bfloat16, enabled=bf16):
+            return forward(words)
+
+    cnn.eval()
+    difference = float((legacyDiscriminator(hiddens) - cnn(
+        hiddens.unsqueeze(1))).abs().max())
+    checkDifference("discriminator", difference, args.atol)
+    difference = float((classify(legacyClassifier, False) - classify(
+        classifier, False)).abs().max())
+    checkDifference("classifier", difference, args.atol)
+    cnn.train()
+
+    for bf16 in [False] + [True] * args.bf16:
+        for name, step in [
+                ("discriminator update Conv2d",
+                 lambda: discriminatorUpdate(legacyDiscriminator, bf16)),
+                ("discriminator update Conv1d",
+                 lambda: discriminatorUpdate(
+                     lambda x: cnn(x.unsqueeze(1)), bf16)),
+                ("classifier inference Conv2d",
+                 lambda: classify(legacyClassifier, bf16)),
+                ("classifier inference Conv1d",
+                 lambda: classify(classifier, bf16))]:
+            step()
+            seconds = timeit.timeit(step, number=args.repeat)
+            report(name + (" bf16" if bf16 else ""), seconds, args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark")
+    subparsers.required = True
+
+    noiseParser = subparsers.add_parser(
+        "noise", help="word dropout and local shuffle of the inputs")
+    noiseParser.add_argument(
+        "--file", type=str, default="data/yelp/dev/positive.txt")
+    noiseParser.add_argument("--batch_size", type=int, default=64)
+    noiseParser.add_argument("--word_drop", type=float, default=0.1)
+    noiseParser.add_argument("--repeat", type=int, default=1000)
+    noiseParser.set_defaults(run=benchmarkNoise)
+
+    preprocessParser = subparsers.add_parser(
+        "preprocess", help="from sentences to padded tensors of ids")
+    preprocessParser.add_argument(
+        "--file", type=str, default="data/yelp/dev/positive.txt")
+    preprocessParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    preprocessParser.add_argument("--batch_size", type=int, default=64)
+    preprocessParser.add_argument("--word_drop", type=float, default=0.1)
+    preprocessParser.add_argument("--repeat", type=int, default=1000)
+    preprocessParser.set_defaults(run=benchmarkPreprocess)
+
+    trainParser = subparsers.add_parser(
+        "train", help="trainOnBatch throughput of parameter variants")
+    trainParser.add_argument(
+        "--file_style1", type=str, default="data/yelp/dev/negative.txt")
+    trainParser.add_argument(
+        "--file_style2", type=str, default="data/yelp/dev/positive.txt")
+    trainParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    trainParser.add_argument("--batches", type=int, default=20)
+    trainParser.add_argument("--warmup", type=int, default=2)
+    trainParser.add_argument(
+        "--variants", type=str, nargs='+', default=[""],
+        help="parameters overriding resources/params.asciipb, in protobuf "
+             "text format, e.g. \"shared_forward: true\"")
+    trainParser.set_defaults(run=benchmarkTrain)
+
+    memoryParser = subparsers.add_parser(
+        "memory", help="peak memory of training for parameter variants")
+    memoryParser.add_argument(
+        "--file_style1", type=str, default="data/yelp/dev/negative.txt")
+    memoryParser.add_argument(
+        "--file_style2", type=str, default="data/yelp/dev/positive.txt")
+    memoryParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    memoryParser.add_argument("--batches", type=int, default=3)
+    memoryParser.add_argument(
+        "--variants", type=str, nargs='+', default=[""],
+        help="parameters overriding resources/params.asciipb, in protobuf "
+             "text format, e.g. \"checkpoint_steps: 5\"")
+    memoryParser.set_defaults(run=benchmarkMemory)
+
+    threadsParser = subparsers.add_parser(
+        "threads", help="training and greedy decoding throughput on CPU "
+                        "for different numbers of intra-op threads")
+    threadsParser.add_argument(
+        "--file_style1", type=str, default="data/yelp/dev/negative.txt")
+    threadsParser.add_argument(
+        "--file_style2", type=str, default="data/yelp/dev/positive.txt")
+    threadsParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    threadsParser.add_argument("--batches", type=int, default=5)
+    threadsParser.add_argument(
+        "--threads", type=int, nargs='+', default=[1, 2, 4, 8])
+    threadsParser.add_argument(
+        "--variant", type=str, default="shared_forward: true",
+        help="parameters overriding resources/params.asciipb")
+    threadsParser.set_defaults(run=benchmarkThreads)
+
+    decodeParser = subparsers.add_parser(
+        "decode", help="implementations of the generation loop, compared "
+                       "with the nn.GRU loop")
+    decodeParser.add_argument(
+        "--file_style1", type=str, default="data/yelp/dev/negative.txt")
+    decodeParser.add_argument(
+        "--file_style2", type=str, default="data/yelp/dev/positive.txt")
+    decodeParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    decodeParser.add_argument(
+        "--loops", type=str, nargs='+', default=["", "script", "compile"])
+    decodeParser.add_argument("--repeat", type=int, default=5)
+    decodeParser.add_argument(
+        "--atol", type=float, default=1e-4,
+        help="largest difference allowed from the nn.GRU loop")
+    decodeParser.set_defaults(run=benchmarkDecode)
+
+    beamParser = subparsers.add_parser(
+        "beam", help="beam search rewrite of the input sentences")
+    beamParser.add_argument(
+        "--file_style1", type=str, default="data/yelp/dev/negative.txt")
+    beamParser.add_argument(
+        "--file_style2", type=str, default="data/yelp/dev/positive.txt")
+    beamParser.add_argument(
+        "--vocabulary", type=str, default="data/yelp/vocabulary.pickle")
+    beamParser.add_argument("--variant", type=str, default="")
+    beamParser.add_argument(
+        "--model", type=str, default="", help="weights of a trained model")
+    beamParser.add_argument(
+        "--mode", type=str, default=BOTH, choices=MODES,
+        help="the sentences rewritten")
+    beamParser.add_argument(
+        "--widths", type=int, nargs='+', default=[1, 4, 8])
+    beamParser.add_argument("--batches", type=int, default=5)
+    beamParser.set_defaults(run=benchmarkBeam)
+
+    convolutionsParser = subparsers.add_parser(
+        "convolutions", help="Conv1d and former Conv2d text convolutions of "
+                             "the discriminators and of the classifier")
+    convolutionsParser.add_argument("--embed_num", type=int, default=10000)
+    convolutionsParser.add_argument(
+        "--classifier_batch_size", type=int, default=256)
+    convolutionsParser.add_argument(
+        "--bf16", action="store_true", help="also under bfloat16 autocast")
+    convolutionsParser.add_argument("--repeat", type=int, default=20)
+    convolutionsParser.add_argument(
+        "--atol", type=float, default=1e-5,
+        help="largest difference allowed from the Conv2d convolutions")
+    convolutionsParser.set_defaults(run=benchmarkConvolutions)
+
+    args = parser.parse_args()
+    args.run(args)
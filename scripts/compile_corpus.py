@@ -0,0 +1,28 @@
+"""
+Compile style files into pre-tokenized corpora (see src/corpus.py),
+so that training does not tokenize the same sentences at every epoch
+"""
+import argparse
+import logging
+import os
+from src.corpus import compileCorpus
+from src.vocabulary import Vocabulary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=str, nargs='+')
+    parser.add_argument("--vocabulary", type=str)
+    parser.add_argument("--output_dir", type=str)
+    args = parser.parse_args()
+
+    vocab = Vocabulary()
+    vocab.loadVocabulary(args.vocabulary)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for fileName in args.files:
+        name = os.path.splitext(os.path.basename(fileName))[0]
+        prefix = os.path.join(args.output_dir, name)
+        numSentences = compileCorpus(fileName, vocab, prefix)
+        logging.info("compiled {0} sentences from {1} into {2}".format(
+            numSentences, fileName, prefix))
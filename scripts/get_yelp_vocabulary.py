@@ -1,31 +1,95 @@
 """
 Get the dictionary word -> id for yelp datasets
 Most common words get lower indices for memory efficiency
+Files are read in chunks of bytes, counted in parallel and merged,
+so that the memory needed does not depend on the size of the files
 """
 import argparse
 import glob
-import pickle
-import re
+import logging
+import os
 from collections import Counter
+from multiprocessing import Pool
+from src.vocabulary import saveVocabulary
+
+
+def fileChunks(fileNames, chunkSize):
+    for fileName in fileNames:
+        fileSize = os.path.getsize(fileName)
+        for start in range(0, fileSize, chunkSize):
+            yield fileName, start, min(start + chunkSize, fileSize)
+
+
+def countChunk(chunk):
+    """
+    Count the words of the lines starting in the byte range [start, end)
+    """
+    fileName, start, end = chunk
+    counts = Counter()
+    with open(fileName, 'rb') as fp:
+        position = start
+        if start > 0:
+            # the line crossing start belongs to the previous chunk
+            fp.seek(start - 1)
+            position += len(fp.readline()) - 1
+        while position < end:
+            line = fp.readline()
+            if not line:
+                break
+            position += len(line)
+            line = line.rstrip(b"\n")
+            if line:
+                counts.update(line.split(b" "))
+    return counts
+
+
+def countWords(fileNames, chunkSize, workers):
+    vocabulary = Counter()
+    with Pool(workers) as pool:
+        for counts in pool.imap_unordered(
+                countChunk, fileChunks(fileNames, chunkSize)):
+            vocabulary.update(counts)
+    return Counter({
+        word.decode('utf-8'): count for word, count in vocabulary.items()})
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("--files", type=str)
     parser.add_argument("--vocabulary_output", type=str)
+    parser.add_argument(
+        "--min_count", type=int, default=1,
+        help="drop the words appearing less than min_count times")
+    parser.add_argument(
+        "--max_size", type=int, default=0,
+        help="keep at most max_size words, 0 means no limit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--chunk_size", type=int, default=1 << 24,
+        help="bytes of text counted by each task")
     args = parser.parse_args()
 
-    vocabulary = Counter()
     fileNames = glob.glob(args.files, recursive=True)
-    for fileName in fileNames:
-        with open(fileName, 'r') as fp:
-            text = fp.read()
-        text = text.strip()
-        text = re.sub("\n", " ", text)
-        vocabulary.update(text.split(" "))
+    vocabulary = countWords(fileNames, args.chunk_size, args.workers)
 
+    # ties are broken alphabetically to get the same vocabulary
+    # for any number of workers
     wordsAndCounts = sorted(
-        list(vocabulary.items()), key=lambda x: x[1], reverse=True)
-    vocabulary = list(map(lambda x: x[0], wordsAndCounts))
-    with open(args.vocabulary_output, 'wb') as fp:
-        pickle.dump(vocabulary, fp)
+        vocabulary.items(), key=lambda x: (-x[1], x[0]))
+    wordsAndCounts = [x for x in wordsAndCounts if x[1] >= args.min_count]
+    if args.max_size > 0:
+        wordsAndCounts = wordsAndCounts[:args.max_size]
+
+    totalTokens = sum(vocabulary.values())
+    keptTokens = sum(x[1] for x in wordsAndCounts)
+    logging.info(
+        "kept {0} words out of {1}, {2:.4%} of the tokens will be "
+        "mapped to <unk>".format(
+            len(wordsAndCounts), len(vocabulary),
+            1 - keptTokens / max(totalTokens, 1)))
+
+    saveVocabulary(
+        args.vocabulary_output,
+        [x[0] for x in wordsAndCounts],
+        [x[1] for x in wordsAndCounts])
@@ -0,0 +1,205 @@
+"""
+HTTP service transferring single sentences to a target style, with the
+concurrent requests decoded together in micro-batches.
+POST /transfer {"sentence": "the food was great", "style": 0}
+    -> {"sentence": ..., "style": 0, "transferred": ...}
+POST /transfer {"sentences": ["the food was great", ...], "style": 0}
+    -> {"sentences": [...], "style": 0, "transferred": [...]}
+GET /metrics -> queue depth and batch size histograms, Prometheus format
+GET /health -> ok
+"""
+import argparse
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+from scripts.train_model import loadParams
+from src.beam_search import BeamSearchDecoder
+from src.execution import configureCpu, configureDevice
+from src.greedy_decoding import GreedyDecoder
+from src.serving import MicroBatcher
+from src.style_transfer import StyleTransfer
+from src.vocabulary import Vocabulary
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parseTransferRequest(body, maxSentences):
+    """
+    Output: the list of sentences, the style, and whether the request
+    holds a list of sentences instead of a single one
+    """
+    try:
+        request = json.loads(body)
+        isList = 'sentences' in request
+        sentences = request['sentences'] if isList \
+            else [request['sentence']]
+        if not isinstance(sentences, list):
+            raise TypeError()
+        style = request['style']
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise BadRequest(
+            'expected a JSON object with a sentence (or a list of '
+            'sentences) and a style')
+    if len(sentences) > maxSentences:
+        raise BadRequest('at most {0} sentences per request'.format(
+            maxSentences))
+    try:
+        sentences = [" ".join(x.split()) for x in sentences]
+    except AttributeError:
+        raise BadRequest('the sentences must be strings')
+    if not sentences or not all(sentences):
+        raise BadRequest('empty sentence')
+    if style not in (0, 1):
+        raise BadRequest('the style must be 0 or 1')
+    return sentences, style, isList
+
+
+class TransferServer(object):
+
+    def __init__(self, batcher, maxBodySize):
+        """
+        maxBodySize -- in bytes, larger request bodies are rejected
+        """
+        self.batcher = batcher
+        self.maxBodySize = maxBodySize
+
+    async def _route(self, method, path, body):
+        """
+        Output: status, content type and body of the response
+        """
+        if method == 'POST' and path == '/transfer':
+            try:
+                sentences, style, isList = parseTransferRequest(
+                    body, self.batcher.maxBatchSize)
+            except BadRequest as e:
+                return HTTPStatus.BAD_REQUEST, 'text/plain', str(e)
+            try:
+                transferred = await self.batcher.transferAll(
+                    sentences, style)
+            except Exception:
+                logging.exception('transfer failed')
+                return HTTPStatus.INTERNAL_SERVER_ERROR, 'text/plain', \
+                    'transfer failed'
+            if isList:
+                response = {'sentences': sentences, 'transferred': transferred}
+            else:
+                response = {
+                    'sentence': sentences[0], 'transferred': transferred[0]}
+            response['style'] = style
+            return HTTPStatus.OK, 'application/json', json.dumps(response)
+        if method == 'GET' and path == '/metrics':
+            return HTTPStatus.OK, 'text/plain; version=0.0.4', \
+                self.batcher.metrics()
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, 'text/plain', 'ok'
+        return HTTPStatus.NOT_FOUND, 'text/plain', 'not found'
+
+    async def handle(self, reader, writer):
+        """
+        Serve the HTTP/1.1 requests of a connection, which is kept alive
+        unless the client asks to close it
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path, version = \
+                    requestLine.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                bodySize = int(headers.get('content-length', 0))
+                if bodySize > self.maxBodySize:
+                    # the body is not read, the connection is closed
+                    status, contentType, content = \
+                        HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'text/plain', \
+                        'at most {0} bytes per request'.format(
+                            self.maxBodySize)
+                    keepAlive = False
+                else:
+                    body = await reader.readexactly(bodySize)
+                    status, contentType, content = await self._route(
+                        method, path, body)
+                    keepAlive = version == 'HTTP/1.1' and \
+                        headers.get('connection', '').lower() != 'close'
+                content = content.encode('utf-8')
+                writer.write((
+                    'HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\n'
+                    'Content-Length: {3}\r\nConnection: {4}\r\n\r\n').format(
+                        status.value, status.phrase, contentType,
+                        len(content),
+                        'keep-alive' if keepAlive else 'close').encode(
+                            'latin-1') + content)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # closed connections and malformed requests
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(batcher, host, port, maxBodySize):
+    server = TransferServer(batcher, maxBodySize)
+    batching = asyncio.create_task(batcher.run())
+    httpServer = await asyncio.start_server(server.handle, host, port)
+    logging.info('Serving on {0}:{1}'.format(host, port))
+    try:
+        async with httpServer:
+            await httpServer.serve_forever()
+    finally:
+        batching.cancel()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, help="weights of the model")
+    parser.add_argument("--vocabulary", type=str)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--decoder", type=str, default="greedy", choices=["greedy", "beam"])
+    parser.add_argument(
+        "--max_batch_size", type=int, default=64,
+        help="most sentences decoded together")
+    parser.add_argument(
+        "--max_delay_ms", type=float, default=10,
+        help="longest wait for the other requests of a batch after the "
+             "first one")
+    parser.add_argument(
+        "--max_body_bytes", type=int, default=64 * 1024,
+        help="larger request bodies are rejected with 413")
+    parser.add_argument(
+        "--device", type=str, default=None,
+        help="device overriding the parameters, e.g. cpu or cuda:1")
+    args = parser.parse_args()
+
+    params = loadParams()
+    if args.device is not None:
+        params.device = args.device
+    configureCpu(params.cpu)
+    device = configureDevice(params.device)
+    vocab = Vocabulary()
+    vocab.loadVocabulary(args.vocabulary)
+    vocab.initializeEmbeddings(params.embedding_size)
+    model = StyleTransfer(params, vocab).to(device)
+    model.load(args.model)
+    model.eval()
+
+    if args.decoder == "beam":
+        decoder = BeamSearchDecoder(model, params)
+    else:
+        decoder = GreedyDecoder(model, params)
+    batcher = MicroBatcher(
+        decoder, args.max_batch_size, args.max_delay_ms / 1000)
+    asyncio.run(serve(batcher, args.host, args.port, args.max_body_bytes))
@@ -1,10 +1,15 @@
 import argparse
 import logging
-import torch
+import random
+import numpy as np
 from google.protobuf import text_format
 from google.protobuf.json_format import MessageToJson
+from src.corpus import compiledBatches
+from src.evaluation import EvaluationSet
+from src.execution import configureCpu, configureDevice
 from src.generate_batches import batchesFromFiles
 from src.parameters_pb2 import StyleTransferParams
+from src.prefetch import BatchPrefetcher
 from src.style_transfer import StyleTransfer
 from src.vocabulary import Vocabulary
 
@@ -35,31 +40,74 @@ if __name__ == "__main__":
     parser.add_argument("--vocabulary", type=str)
     parser.add_argument("--savefile", type=str)
     parser.add_argument("--logdir", type=str, default="")
+    parser.add_argument(
+        "--compiled_corpus", action="store_true",
+        help="the train files are prefixes of compiled corpora")
+    parser.add_argument(
+        "--resume", type=str, default="",
+        help="training state saved by an interrupted training, "
+             "e.g. <savefile>.state")
+    parser.add_argument(
+        "--device", type=str, default=None,
+        help="device overriding the parameters, e.g. cpu or cuda:1")
     args = parser.parse_args()
 
-    params = loadParams(args.machine)
+    params = loadParams()
     params.savefile = args.savefile
     params.logdir = args.logdir
+    if args.device is not None:
+        params.device = args.device
     printParams(params)
+    configureCpu(params.cpu)
+    device = configureDevice(params.device)
     vocab = Vocabulary()
     vocab.loadVocabulary(args.vocabulary)
     vocab.initializeEmbeddings(params.embedding_size)
 
     logging.info("beginning train_yelp")
-    model = StyleTransfer(params, vocab)
-    if torch.cuda.is_available():
-        model = model.cuda()
+    model = StyleTransfer(params, vocab).to(device)
 
-    trainBatches = batchesFromFiles(
-        style1=args.train_file_style1,
-        style2=args.train_file_style2,
-        batchsize=params.batch_size,
-        inMemory=True)
+    # the in-memory batches are shuffled when they are loaded, with the same
+    # seed they are loaded again in the same order by a resumed training
+    random.seed(params.seed)
+    np.random.seed(params.seed)
+    if args.compiled_corpus:
+        trainBatches = compiledBatches(
+            style1=args.train_file_style1,
+            style2=args.train_file_style2,
+            batchsize=params.batch_size,
+            bucketSize=params.bucket_size)
+    else:
+        trainBatches = batchesFromFiles(
+            style1=args.train_file_style1,
+            style2=args.train_file_style2,
+            batchsize=params.batch_size,
+            inMemory=params.in_memory,
+            bufferSize=params.shuffle_buffer_size,
+            bucketSize=params.bucket_size)
+
+    if params.prefetch_workers > 0:
+        trainBatches = BatchPrefetcher(
+            trainBatches, vocab.word2id,
+            noisy=True,
+            word_drop=params.autoencoder.word_drop,
+            numWorkers=params.prefetch_workers,
+            prefetch=params.prefetch_batches,
+            seed=params.seed)
 
-    validSet = batchesFromFiles(
+    # encoded once, evaluated at the end of every epoch
+    validSet = EvaluationSet(batchesFromFiles(
         style1=args.evaluation_file_style1,
         style2=args.evaluation_file_style2,
         batchsize=params.batch_size,
-        inMemory=True)
+        inMemory=True), vocab.word2id)
+    sampleSet = None
+    if params.evaluation_sample_size > 0:
+        sampleSet = validSet.subsample(
+            params.evaluation_sample_size, seed=params.seed)
 
-    model.trainModel(trainBatches, validSet)
+    if args.resume:
+        model.resume(args.resume, trainBatches)
+    model.trainModel(trainBatches, validSet, sampleBatches=sampleSet)
+    if isinstance(trainBatches, BatchPrefetcher):
+        trainBatches.close()
@@ -0,0 +1,188 @@
+"""
+Transfer every line of a file to a target style, writing the results in
+the same order, one per line.
+Chunks of lines are decoded by worker processes sharing the weights of the
+model, each chunk sorted by length so that its batches have little
+padding. The progress is saved in <output>.progress after every chunk
+written, and an interrupted run started again with the same arguments
+continues from there.
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import torch
+import torch.multiprocessing as mp
+from tqdm import tqdm
+from scripts.train_model import loadParams
+from src.beam_search import BeamSearchDecoder
+from src.decoder import TRANSFER
+from src.execution import configureCpu, configureDevice
+from src.greedy_decoding import GreedyDecoder
+from src.parameters_pb2 import StyleTransferParams
+from src.style_transfer import StyleTransfer
+from src.vocabulary import Vocabulary
+
+# state of each worker process, set by _initWorker
+_decoder = None
+_batchSize = 0
+
+
+def _initWorker(
+        stateDict, serializedParams, vocabularyFile, decoderName, batchSize,
+        numThreads):
+    global _decoder, _batchSize
+    # the workers share the cores, each one runs its own batches
+    torch.set_num_threads(numThreads)
+    params = StyleTransferParams.FromString(serializedParams)
+    configureDevice(params.device)
+    vocab = Vocabulary()
+    vocab.loadVocabulary(vocabularyFile)
+    vocab.initializeEmbeddings(params.embedding_size)
+    model = StyleTransfer(params, vocab)
+    # the parameters become the tensors in shared memory, not copies
+    model.load_state_dict(stateDict, assign=True)
+    model.eval()
+    if decoderName == "beam":
+        _decoder = BeamSearchDecoder(model, params)
+    else:
+        _decoder = GreedyDecoder(model, params)
+    _batchSize = batchSize
+
+
+def transferChunk(lines, label):
+    """
+    Transfer the sentences of lines, encoded with the label label, in
+    batches of sentences of similar length
+    Output: the transferred sentences, in the order of lines
+    """
+    sentences = [" ".join(line.split()) for line in lines]
+    # empty lines stay empty
+    order = sorted(
+        (i for i, x in enumerate(sentences) if x),
+        key=lambda i: sentences[i].count(" "))
+    transferred = [""] * len(sentences)
+    with torch.inference_mode():
+        for start in range(0, len(order), _batchSize):
+            batch = order[start:start + _batchSize]
+            rewritten = _decoder.rewriteBatch(
+                [sentences[i] for i in batch], [label] * len(batch),
+                mode=TRANSFER)[1]
+            for i, sentence in zip(batch, rewritten):
+                transferred[i] = sentence
+    return transferred
+
+
+def readChunks(fileName, chunkSize, skip):
+    """
+    The lines of fileName after the first skip ones, in lists of chunkSize
+    """
+    with open(fileName, 'r', encoding='utf-8') as fp:
+        lines = (
+            line.rstrip('\n') for line in itertools.islice(fp, skip, None))
+        while True:
+            chunk = list(itertools.islice(lines, chunkSize))
+            if not chunk:
+                return
+            yield chunk
+
+
+def loadProgress(progressFile):
+    if not os.path.exists(progressFile):
+        return {'lines': 0, 'offset': 0}
+    with open(progressFile, 'r') as fp:
+        return json.load(fp)
+
+
+def saveProgress(progressFile, progress):
+    tmpFileName = progressFile + '.tmp'
+    with open(tmpFileName, 'w') as fp:
+        json.dump(progress, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmpFileName, progressFile)
+
+
+def transferFile(args, stateDict, params):
+    progressFile = args.output + '.progress'
+    progress = loadProgress(progressFile)
+    if progress['lines'] > 0:
+        logging.info('Resuming after {0} lines'.format(progress['lines']))
+    # the lines written after the last saved progress are written again
+    mode = 'r+b' if progress['offset'] > 0 else 'wb'
+    label = 1 - args.style
+    # forked workers can hang in the OpenMP thread pool of the parent
+    context = mp.get_context('spawn')
+    with open(args.output, mode) as output, context.Pool(
+            args.workers, initializer=_initWorker,
+            initargs=(stateDict, params.SerializeToString(),
+                      args.vocabulary, args.decoder,
+                      args.batch_size, args.threads_per_worker)) as pool:
+        output.seek(progress['offset'])
+        output.truncate()
+        progbar = tqdm(initial=progress['lines'], unit='lines')
+        pending = collections.deque()
+
+        def writeNext():
+            transferred = pending.popleft().get()
+            output.write(''.join(x + '\n' for x in transferred).encode(
+                'utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+            progress['lines'] += len(transferred)
+            progress['offset'] = output.tell()
+            saveProgress(progressFile, progress)
+            progbar.update(len(transferred))
+
+        # at most two chunks per worker are read ahead of the output
+        for chunk in readChunks(
+                args.input, args.chunk_size, progress['lines']):
+            pending.append(pool.apply_async(transferChunk, (chunk, label)))
+            if len(pending) >= 2 * args.workers:
+                writeNext()
+        while pending:
+            writeNext()
+        progbar.close()
+    os.remove(progressFile)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, help="one sentence per line")
+    parser.add_argument("--output", type=str)
+    parser.add_argument(
+        "--style", type=int, choices=[0, 1],
+        help="the target style of the sentences")
+    parser.add_argument("--model", type=str, help="weights of the model")
+    parser.add_argument("--vocabulary", type=str)
+    parser.add_argument(
+        "--decoder", type=str, default="greedy", choices=["greedy", "beam"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads_per_worker", type=int, default=1)
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument(
+        "--chunk_size", type=int, default=4096,
+        help="lines sorted by length and decoded by one worker at a time")
+    parser.add_argument(
+        "--device", type=str, default=None,
+        help="device overriding the parameters, e.g. cpu or cuda:1")
+    args = parser.parse_args()
+
+    params = loadParams()
+    if args.device is not None:
+        params.device = args.device
+    configureCpu(params.cpu)
+    configureDevice(params.device)
+    vocab = Vocabulary()
+    vocab.loadVocabulary(args.vocabulary)
+    vocab.initializeEmbeddings(params.embedding_size)
+    model = StyleTransfer(params, vocab)
+    model.load(args.model)
+    # the workers use these weights instead of copies
+    stateDict = {
+        k: v.share_memory_() for k, v in model.state_dict().items()}
+
+    transferFile(args, stateDict, params)
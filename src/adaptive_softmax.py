@@ -0,0 +1,46 @@
+import torch.nn as nn
+
+
+class AdaptiveHiddenToVocab(nn.Module):
+    """
+    Adaptive softmax output layer (Grave et al. 2017), exploiting the
+    vocabulary sorted by decreasing frequency.
+    It can replace the dense hiddenToVocab Linear layer: forward returns
+    log-probabilities, which can be used wherever logits are expected
+    (softmax, Gumbel-softmax, argmax and top-k are not affected by the
+    normalizing constant). The training loss and the greedy choice of the
+    most probable words only evaluate the clusters they need.
+    """
+
+    def __init__(self, hidden_size, vocabSize, cutoffs, div_value=4.0):
+        """
+        Args:
+        cutoffs -- increasing word ids where a new cluster of the vocabulary
+                   begins, e.g. [2000, 10000]
+        div_value -- each cluster projects the hidden states to a size
+                     div_value times smaller than the previous one
+        """
+        super().__init__()
+        self.adaptiveSoftmax = nn.AdaptiveLogSoftmaxWithLoss(
+            hidden_size, vocabSize, list(cutoffs), div_value=div_value)
+
+    def forward(self, hidden):
+        """
+        hidden -- (..., hidden_size)
+        Output: log-probabilities of shape (..., vocabSize)
+        """
+        flat = hidden.reshape(-1, hidden.shape[-1])
+        logProbs = self.adaptiveSoftmax.log_prob(flat)
+        return logProbs.view(*hidden.shape[:-1], -1)
+
+    def loss(self, hidden, targets):
+        """
+        Mean negative log-likelihood of targets, hidden -- (N, hidden_size)
+        """
+        return self.adaptiveSoftmax(hidden, targets).loss
+
+    def predict(self, hidden):
+        """
+        Most probable word ids, hidden -- (N, hidden_size)
+        """
+        return self.adaptiveSoftmax.predict(hidden)
@@ -1,38 +1,168 @@
 import datetime
+import itertools
+import logging
 import random
+import numpy as np
 import torch
 from torch import nn
 from tqdm import tqdm
+from src.checkpointing import CheckpointWriter
 
 
 class BaseModel(nn.Module):
     def __init__(self):
         super().__init__()
         self.iter = 0
+        # position in the training data: the current epoch and the number
+        # of its batches already trained
+        self.epoch = 0
+        self.epochBatch = 0
+        # the order of the batches of the epoch, when they are a list
+        self.batchOrder = None
+        self.checkpointWriter = CheckpointWriter()
 
     def load(self, fileName):
         checkpoint = torch.load(fileName)
         self.load_state_dict(checkpoint)
 
-    def trainModel(self, trainBatches, validBatches, shuffle=True):
-        for epochIndex, epoch in enumerate(range(self.params.epochs)):
-            if shuffle:
-                random.shuffle(trainBatches)
-            self.runEpoch(trainBatches, validBatches, epoch, epochIndex)
+    def trainModel(
+            self, trainBatches, validBatches, shuffle=True,
+            sampleBatches=None):
+        """
+        sampleBatches -- the batches evaluated every evaluation_interval
+                         batches, e.g. a subsample of validBatches
+        """
+        if isinstance(trainBatches, list) and self.batchOrder is None:
+            self.batchOrder = list(range(len(trainBatches)))
+        for epochIndex, epoch in enumerate(
+                range(self.epoch, self.params.epochs), self.epoch):
+            # a resumed epoch keeps the order of its batches
+            if shuffle and self.epochBatch == 0:
+                if isinstance(trainBatches, list):
+                    random.shuffle(self.batchOrder)
+                else:
+                    # lazy batch collections shuffle themselves
+                    trainBatches.shuffle()
+            self.runEpoch(
+                trainBatches, validBatches, epoch, epochIndex, sampleBatches)
+        self.checkpointWriter.wait()
 
-    def runEpoch(self, trainBatches, validBatches, epoch, epochIndex):
+    def _epochBatches(self, trainBatches):
+        """
+        The batches of the current epoch not trained yet
+        """
+        if isinstance(trainBatches, list):
+            return (trainBatches[i] for i in self.batchOrder[
+                self.epochBatch:])
+        if hasattr(trainBatches, 'iterFrom'):
+            return trainBatches.iterFrom(self.epochBatch)
+        return itertools.islice(trainBatches, self.epochBatch, None)
+
+    def runEpoch(
+            self, trainBatches, validBatches, epoch, epochIndex,
+            sampleBatches=None):
         # TODO risolvere visualizzazione doppia progbar
-        progbar = tqdm(range(len(trainBatches)))
-        for index in progbar:
+        progbar = tqdm(
+            self._epochBatches(trainBatches), total=len(trainBatches),
+            initial=self.epochBatch)
+        for inputs, labels in progbar:
             self.iter += 1
-            inputs, labels = trainBatches[index]
             loss = self.trainOnBatch(inputs, labels, self.iter)
+            self.epochBatch += 1
             progbar.set_description("Loss: {0:.6f}".format(loss))
+            if self.params.checkpoint_interval > 0 and \
+                    self.iter % self.params.checkpoint_interval == 0:
+                self.saveTrainingState(trainBatches)
+            if sampleBatches is not None and \
+                    self.params.evaluation_interval > 0 and \
+                    self.iter % self.params.evaluation_interval == 0:
+                self.evaluateSample(sampleBatches)
 
+        self.epoch += 1
+        self.epochBatch = 0
         evaluationLoss = self.evaluate(validBatches, epochIndex)
         tqdm.write("Epoch {0}/{1}, Loss on evaluation set: {2}".format(
             epoch + 1, self.params.epochs, evaluationLoss))
         date = datetime.datetime.now().strftime("%Y-%m-%d")
         fileName = '{0}-{1}-epoch_{2}-loss_{3}'.format(
             self.params.savefile, date, epoch, "{0:4f}".format(evaluationLoss))
-        torch.save(self.state_dict(), fileName)
+        # both checkpoints are written by the same background job, so that
+        # the second one does not wait for the first one
+        self.checkpointWriter.saveAll([
+            (self.state_dict(), fileName),
+            (self.trainingState(trainBatches), self._trainingStateFile())])
+
+    def evaluateSample(self, sampleBatches):
+        losses = self.evaluateLosses(sampleBatches)
+        losses = ", ".join(
+            "{0} {1:.4f}".format(k, float(v.mean()))
+            for k, v in sorted(losses.items()))
+        tqdm.write("Iteration {0}, losses on the evaluation sample: {1}"
+                   .format(self.iter, losses))
+
+    def _optimizers(self):
+        return {
+            name: value for name, value in vars(self).items()
+            if isinstance(value, torch.optim.Optimizer)}
+
+    def trainingState(self, trainBatches):
+        """
+        Everything needed to resume the training from the next batch
+        """
+        if isinstance(trainBatches, list):
+            dataState = {'order': self.batchOrder}
+        else:
+            dataState = trainBatches.state_dict()
+        rngState = {
+            'torch': torch.get_rng_state(),
+            'numpy': np.random.get_state(),
+            'random': random.getstate()}
+        if torch.cuda.is_available():
+            rngState['cuda'] = torch.cuda.get_rng_state_all()
+        return {
+            'model': self.state_dict(),
+            'optimizers': {
+                name: optimizer.state_dict()
+                for name, optimizer in self._optimizers().items()},
+            'rng': rngState,
+            'iter': self.iter,
+            'epoch': self.epoch,
+            'epochBatch': self.epochBatch,
+            'data': dataState}
+
+    def saveTrainingState(self, trainBatches):
+        """
+        Save the training state to savefile.state in background
+        """
+        self.checkpointWriter.save(
+            self.trainingState(trainBatches), self._trainingStateFile())
+
+    def _trainingStateFile(self):
+        return '{0}.state'.format(self.params.savefile)
+
+    def resume(self, fileName, trainBatches):
+        """
+        Restore the training state saved in fileName, trainBatches must be
+        built as in the interrupted training
+        """
+        state = torch.load(fileName, map_location='cpu', weights_only=False)
+        self.loadTrainingState(state, trainBatches)
+        logging.info('Resuming from epoch {0}, batch {1}'.format(
+            self.epoch, self.epochBatch))
+
+    def loadTrainingState(self, state, trainBatches):
+        self.load_state_dict(state['model'])
+        for name, optimizer in self._optimizers().items():
+            optimizer.load_state_dict(state['optimizers'][name])
+        torch.set_rng_state(state['rng']['torch'])
+        np.random.set_state(state['rng']['numpy'])
+        random.setstate(state['rng']['random'])
+        if 'cuda' in state['rng'] and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state['rng']['cuda'])
+        self.iter = state['iter']
+        self.epoch = state['epoch']
+        self.epochBatch = state['epochBatch']
+        if isinstance(trainBatches, list):
+            self.batchOrder = state['data']['order']
+        else:
+            trainBatches.load_state_dict(state['data'])
@@ -1,114 +1,142 @@
-import time
 import torch
 import torch.nn.functional as F
-from copy import deepcopy
+from src.decoder import Decoder
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-
-class BeamState(object):
-
-    def __init__(self, word, h, sentence, nll):
-        """
-        Args:
-            word -- the id of the word charachterising the state
-            h -- the hidden state associated to that state
-            sentence -- a list of word ids (the past ids plus the current one)
-            nll -- the negative log likelihood corresponding to the sentence
-        """
-        self.word, self.h, self.sentence, self.nll = \
-            word, h, sentence, nll
-
-
-class BeamSearchDecoder(object):
+class BeamSearchDecoder(Decoder):
+    """
+    Beam search over a whole batch: the width beams of each sentence are
+    the rows of (batch_size * width) tensors, the beams of sentence b being
+    the rows b * width, ..., (b + 1) * width - 1.
+    """
 
     def __init__(self, styleTransfer, params):
-        self.model = styleTransfer
+        super().__init__(styleTransfer, params)
         self.max_length = params.max_len
         self.width = params.beam_width
-        self.params = params
 
-    def _decode(self, tokens, h):
+    def _decode(self, ids, h):
         """
+        Run the generator one step for every beam
         Args:
-            tokens --
-            h --
+            ids -- the last word of each beam (batch_size * width)
+            h -- the hidden states (num_layers, batch_size * width, hidden)
         Outputs:
-            logProbs --
-            indices --
-            h --
+            logProbs -- log-probabilities of the next word of each beam
+                        (batch_size * width, vocab_size)
+            h -- the next hidden states
         """
-        currTokens = tokens
-        currh = h
-        # generate next h state and logit
-        # generator needs input (seq_len, batch_size, input_size)
-        outs, h = self.model.generator(currTokens, currh, pad=False)
-        vocabLogits = self.model.hiddenToVocab(h)
-        vocabLogits = vocabLogits[0]
-        # smooth logits into the probabilities of each word
-        vocabProbs = F.softmax(
+        embs = self.model.vocabulary(ids, byWord=False).unsqueeze(1)
+        # generator needs input (batch_size, seq_len, input_size)
+        _, h = self.model.generator(embs, h, pad=False)
+        vocabLogits = self.model.hiddenToVocab(h[-1]).float()
+        # smooth logits into the log-probabilities of each word
+        logProbs = F.log_softmax(
             vocabLogits / self.params.temperature, dim=1)
-        # beam search trick to prevent probs vanishing
-        logProbs = torch.log(vocabProbs)
-        # take the beam_with most probable words
-        logProbs, indices = torch.topk(logProbs, self.width, dim=-1)
-        return logProbs, indices, h
+        return logProbs, h
 
-    def _beamDecode(self, h0):
+    def _beamSearch(self, h0):
         """
-        Returning the ids of the beam_width most probable sentences' words.
-
+        Beam search until every batch element has found a finished sentence
+        more likely than all its beams, or max_length words have been
+        generated. Finished batch elements are dropped from the beams, so
+        that later steps run on fewer rows.
         Args:
-            h0 -- the first hidden state of dim = dim_y + dim_z
+            h0 -- the first hidden states (num_layers, batch_size, hidden)
+        Output:
+            ids -- (batch_size, max_length) the words of the most probable
+                   sentence of each batch element, followed by padding
+            lengths -- (batch_size) the number of words before <eos>
         """
-        batch_size = h0.shape[1]
-        go = ['<go>'] * batch_size
-        init_state = BeamState(
-            go,
-            h0,
-            [[] for i in range(batch_size)],
-            [0]*batch_size)
-        beam = [init_state]
-        for _ in range(self.max_length):
-            storeBeamLayer = [[] for _ in range(batch_size)]
-            for state in beam:
-                embs = self.model.vocabulary(state.word)
-                embs = embs.unsqueeze(1)
-                logProbs, indices, h = self._decode(embs, state.h)
-                for b in range(batch_size):
-                    for w in range(self.width):
-                        word = self.model.vocabulary.id2word[int(indices[b, w])]
-                        storeBeamLayer[b].append(
-                            BeamState(word,
-                                      h[:, b, :],
-                                      state.sentence[b] + [indices[b, w]],
-                                      state.nll[b] - logProbs[b, w]))
+        batchSize = h0.shape[1]
+        width = self.width
+        word2id = self.model.vocabulary.word2id
+        eos = word2id['<eos>']
+        h = h0.repeat_interleave(width, dim=1)
+        ids = torch.full(
+            (batchSize * width,), word2id['<go>'], dtype=torch.long,
+            device=h0.device)
+        # log-likelihood of each beam, only the first one is alive at the
+        # beginning so that the first step expands it into width words
+        scores = torch.full(
+            (batchSize, width), float('-inf'), device=h0.device)
+        scores[:, 0] = 0
+        sentences = ids.new_empty((batchSize * width, 0))
+        # the most probable finished sentence of each batch element
+        best = torch.full(
+            (batchSize, self.max_length), word2id['<pad>'],
+            dtype=torch.long, device=h0.device)
+        bestLengths = torch.full(
+            (batchSize,), self.max_length, dtype=torch.long,
+            device=h0.device)
+        bestScores = torch.full(
+            (batchSize,), float('-inf'), device=h0.device)
+        # the batch elements still being decoded
+        active = torch.arange(batchSize, device=h0.device)
+        # the row of the first beam of each batch element
+        offsets = torch.arange(
+            0, batchSize * width, width, device=h0.device).unsqueeze(1)
+        for step in range(self.max_length):
+            logProbs, h = self._decode(ids, h)
+            numActive, vocabSize = len(active), logProbs.shape[1]
+            candidates = scores.view(-1, 1) + logProbs
+            # each beam has a single <eos> continuation, so the best
+            # 2 * width continuations include width which do not end the
+            # sentence
+            topScores, indices = candidates.view(numActive, -1).topk(
+                2 * width, dim=1)
+            isEos = indices % vocabSize == eos
+
+            # a finished sentence only counts if it ranks among the best
+            # width continuations, as in a beam search which keeps them
+            finishedScore, finished = topScores[:, :width].masked_fill(
+                ~isEos[:, :width], float('-inf')).max(1)
+            improved = (finishedScore > bestScores[active]).nonzero()[:, 0]
+            if len(improved) > 0:
+                beams = improved * width + \
+                    indices[improved, finished[improved]] // vocabSize
+                best[active[improved], :step] = sentences[beams]
+                bestLengths[active[improved]] = step
+                bestScores[active[improved]] = finishedScore[improved]
+
+            # the width best continuations which do not end the sentence,
+            # sorted by decreasing log-likelihood
+            scores, order = topScores.masked_fill(
+                isEos, float('-inf')).topk(width, dim=1)
+            indices = indices.gather(1, order)
+            beams = (offsets[:numActive] + indices // vocabSize).view(-1)
+            ids = (indices % vocabSize).view(-1)
+            h = h.index_select(1, beams)
+            sentences = torch.cat(
+                (sentences.index_select(0, beams), ids.unsqueeze(1)), dim=1)
+
+            # the log-likelihood of a beam can only decrease, a batch element
+            # is done when its best finished sentence is more likely than
+            # its best beam
+            done = bestScores[active] >= scores[:, 0]
+            if done.any():
+                alive = ~done
+                active, scores = active[alive], scores[alive]
+                rows = alive.repeat_interleave(width)
+                ids, h, sentences = ids[rows], h[:, rows], sentences[rows]
+                if len(active) == 0:
+                    break
 
-            beam = [init_state for _ in range(self.width)]
-            for b in range(batch_size):
-                # sort beam states by their probability (cumulated nll)
-                # TODO check if performance increase by dividing nll
-                # by number of words
-                sortedBeamLayer = sorted(storeBeamLayer[b], key=lambda k: k.nll)
-                for w in range(self.width):
-                    beam[w].word[b] = sortedBeamLayer[w].word
-                    beam[w].h[:, b, :] = sortedBeamLayer[w].h
-                    beam[w].sentence[b] = sortedBeamLayer[w].sentence
-                    beam[w].nll[b] = sortedBeamLayer[w].nll
+        # the batch elements whose best beam did not generate <eos> in
+        # max_length words, but is more likely than their finished sentences
+        if len(active) > 0:
+            unfinished = (scores[:, 0] > bestScores[active]).nonzero()[:, 0]
+            best[active[unfinished]] = sentences.view(
+                len(active), width, -1)[unfinished, 0]
+            bestLengths[active[unfinished]] = self.max_length
+        return best, bestLengths
 
-        # Returning the ids of the beam_width most probable sentences' words.
-        sentences = beam[0].sentence
-        sentences = [
-            [self.model.vocabulary.id2word[i] for i in sent]
-            for sent in sentences]
-        # TODO strip the EOS
-        sentences = list(map(lambda x: " ".join(x), sentences))
-        return sentences
+    def _decodeSentences(self, h0):
+        """
+        Returning the most probable sentence of each batch element,
+        without <eos>.
 
-    def rewriteBatch(self, sentences, labels):
-        self.model.transformBatch(sentences, labels)
-        originalHiddens = self.model.originalHiddens
-        transformedHiddens = self.model.transformedHiddens
-        original = self._beamDecode(originalHiddens)
-        transformed = self._beamDecode(transformedHiddens)
-        return original, transformed
+        Args:
+            h0 -- the first hidden state of dim = dim_y + dim_z
+        """
+        return self.model.vocabulary.idsToSentences(*self._beamSearch(h0))
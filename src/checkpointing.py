@@ -0,0 +1,81 @@
+"""
+Checkpoints written from a background thread
+"""
+import os
+import threading
+import numpy as np
+import torch
+
+
+def cpuCopy(obj):
+    """
+    Copy of obj where every tensor is cloned on CPU and every numpy array
+    is copied, so that it can be written while the training keeps updating
+    the originals in place
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        copy = type(obj)((k, cpuCopy(v)) for k, v in obj.items())
+        if hasattr(obj, '_metadata'):
+            # the versions of the modules of a state_dict
+            copy._metadata = obj._metadata
+        return copy
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(cpuCopy(x) for x in obj)
+    return obj
+
+
+class CheckpointWriter(object):
+    """
+    Save checkpoints from a background thread, one at a time.
+    Each checkpoint is written to a temporary file which is then renamed,
+    so that the file always holds a complete checkpoint, the previous one
+    or the new one, even if the process is killed while writing.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.error = None
+
+    def save(self, obj, fileName):
+        """
+        Copy obj and write it to fileName in background, after the
+        checkpoint being written, if any
+        """
+        self.saveAll([(obj, fileName)])
+
+    def saveAll(self, checkpoints):
+        """
+        Copy every (obj, fileName) pair of checkpoints and write them one
+        after the other in a single background job
+        """
+        copies = [(cpuCopy(obj), fileName) for obj, fileName in checkpoints]
+        self.wait()
+        self.thread = threading.Thread(target=self._write, args=(copies,))
+        self.thread.start()
+
+    def _write(self, checkpoints):
+        try:
+            for obj, fileName in checkpoints:
+                tmpFileName = fileName + '.tmp'
+                with open(tmpFileName, 'wb') as fp:
+                    torch.save(obj, fp)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                os.replace(tmpFileName, fileName)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+        """
+        Wait for the checkpoint being written, raising its errors
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
@@ -0,0 +1,137 @@
+"""
+Pre-tokenized style corpora stored as flat token-id arrays.
+
+A compiled corpus with prefix P is made of two raw little-endian files:
+P.ids -- the int32 ids of every token of every sentence, concatenated
+P.offsets -- (num_sentences + 1) int64 offsets into P.ids, so that sentence
+             i is ids[offsets[i]:offsets[i + 1]]
+Both files are opened as np.memmap, so loading a corpus is near-instant and
+sentences are served as views without any Python string on the heap.
+"""
+from array import array
+import numpy as np
+from src.generate_batches import BucketedBatches
+
+_IDS_SUFFIX = '.ids'
+_OFFSETS_SUFFIX = '.offsets'
+# number of tokens buffered in memory before being flushed to disk
+_FLUSH_SIZE = 1 << 20
+
+
+def compileCorpus(fileName, vocabulary, outputPrefix):
+    """
+    Tokenize a style file with the given Vocabulary and write it as a
+    compiled corpus. Unknown words are mapped to the '<unk>' id.
+    Returns the number of compiled sentences.
+    """
+    word2id = vocabulary.word2id
+    unkId = word2id['<unk>']
+    offsets = array('q', [0])
+    buffer = array('i')
+    numTokens = 0
+    with open(fileName, 'r') as fp, \
+            open(outputPrefix + _IDS_SUFFIX, 'wb') as idsFp:
+        for line in fp:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            ids = [word2id.get(word, unkId) for word in line.split(" ")]
+            buffer.extend(ids)
+            numTokens += len(ids)
+            offsets.append(numTokens)
+            if len(buffer) >= _FLUSH_SIZE:
+                buffer.tofile(idsFp)
+                buffer = array('i')
+        buffer.tofile(idsFp)
+
+    with open(outputPrefix + _OFFSETS_SUFFIX, 'wb') as offsetsFp:
+        offsets.tofile(offsetsFp)
+    return len(offsets) - 1
+
+
+class CompiledCorpus(object):
+    """
+    Read-only view over a compiled corpus
+    """
+
+    def __init__(self, prefix):
+        self.offsets = np.memmap(
+            prefix + _OFFSETS_SUFFIX, dtype=np.int64, mode='r')
+        if self.offsets[-1] > 0:
+            self.ids = np.memmap(
+                prefix + _IDS_SUFFIX, dtype=np.int32, mode='r')
+        else:
+            # np.memmap can not map empty files
+            self.ids = np.zeros(0, dtype=np.int32)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+
+class CompiledBatches(object):
+    """
+    Balanced batches served lazily from two compiled corpora.
+    Each batch is a pair (sentences, labels) as produced by
+    loadFilesAndGenerateBatches, where sentences are int32 id arrays
+    (memmap views) instead of strings. Only the sentence indices of each
+    batch are kept in memory.
+    """
+
+    def __init__(self, corpora, batchsize, shuffleFiles=True, seed=None):
+        self.corpora = corpora
+        self.rng = np.random.RandomState(seed)
+        iterStep = batchsize // len(corpora)
+        numBatches = min(map(len, corpora)) // iterStep
+        # order[b, c] holds the sentences of corpus c used by batch b
+        order = []
+        for corpus in corpora:
+            indices = np.arange(len(corpus))
+            if shuffleFiles:
+                self.rng.shuffle(indices)
+            order.append(indices[:numBatches * iterStep].reshape(
+                numBatches, iterStep))
+        self.order = np.stack(order, axis=1)
+
+    def shuffle(self):
+        self.rng.shuffle(self.order)
+
+    def state_dict(self):
+        # shuffle permutes self.order in place
+        return {'order': self.order.copy(), 'rng': self.rng.get_state()}
+
+    def load_state_dict(self, state):
+        self.order = state['order']
+        self.rng.set_state(state['rng'])
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        inputs = []
+        labels = []
+        for label, (corpus, indices) in enumerate(
+                zip(self.corpora, self.order[index])):
+            inputs.extend(corpus[i] for i in indices)
+            labels.extend([label] * len(indices))
+        return inputs, labels
+
+
+def compiledBatches(
+        style1, style2, batchsize, shuffleFiles=True, seed=None,
+        bucketSize=0):
+    """
+    Same as loadFilesAndGenerateBatches, reading the compiled corpora
+    with prefixes style1 and style2. If bucketSize > 0 the batches
+    are built by BucketedBatches.
+    """
+    corpora = [CompiledCorpus(style1), CompiledCorpus(style2)]
+    if bucketSize > 0:
+        return BucketedBatches(corpora, batchsize, bucketSize, seed)
+    return CompiledBatches(corpora, batchsize, shuffleFiles, seed)
@@ -0,0 +1,50 @@
+"""
+Rewriting of batches of sentences, shared by the greedy and the beam search
+decoders
+"""
+import torch
+from src.execution import autocast
+
+# the sentences decoded by rewriteBatch
+RECONSTRUCT = 'reconstruct'
+TRANSFER = 'transfer'
+BOTH = 'both'
+MODES = (RECONSTRUCT, TRANSFER, BOTH)
+
+
+class Decoder(object):
+
+    def __init__(self, styleTransfer, params):
+        self.model = styleTransfer
+        self.params = params
+
+    def _decodeSentences(self, h0s):
+        """
+        The sentences generated from the first hidden states h0s
+        (num_layers, batch_size, hidden_size)
+        """
+        raise NotImplementedError
+
+    def rewriteBatch(self, sentences, labels, mode=BOTH):
+        """
+        Args:
+        mode -- RECONSTRUCT for the sentences generated with their own
+                labels, TRANSFER for the ones generated with the inverted
+                labels, or BOTH, decoded together as a single batch
+        Output:
+        original, transformed -- lists of sentences, None if not decoded
+        """
+        if mode not in MODES:
+            raise ValueError('Unknown decoding mode {0}'.format(mode))
+        with autocast(self.params):
+            self.model.transformBatch(sentences, labels)
+            originalHiddens = self.model.originalHiddens
+            transformedHiddens = self.model.transformedHiddens
+            if mode == RECONSTRUCT:
+                return self._decodeSentences(originalHiddens), None
+            if mode == TRANSFER:
+                return None, self._decodeSentences(transformedHiddens)
+            decoded = self._decodeSentences(
+                torch.cat((originalHiddens, transformedHiddens), dim=1))
+        batchSize = originalHiddens.shape[1]
+        return decoded[:batchSize], decoded[batchSize:]
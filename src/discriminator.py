@@ -3,6 +3,17 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 
+def conv2dToConv1dWeight(weight):
+    """
+    Turn the weight (out_channels, in_channels, ks, hidden_size) of a
+    Conv2d whose kernels span the whole hidden size into the weight
+    (out_channels, in_channels * hidden_size, ks) of the equivalent Conv1d
+    """
+    outChannels, inChannels, ks, hiddenSize = weight.shape
+    return weight.permute(0, 1, 3, 2).reshape(
+        outChannels, inChannels * hiddenSize, ks)
+
+
 class Cnn(nn.Module):
     """
         GAN discriminator is a TextCNN
@@ -24,31 +35,124 @@ class Cnn(nn.Module):
         super().__init__()
 
         self.dropoutLayer = nn.Dropout(p=dropout)
-        # build parallel CNNs with different kernel sizes
+        # build parallel CNNs with different kernel sizes, each hidden
+        # state of each input feature map is a channel of the 1-D
+        # convolution over time
         self.convs = nn.ModuleList([])  # CHECK CONVS ON ORIGINAL PAPER
         for ks in kernel_sizes:
-            conv = nn.Conv2d(
-                in_channels=in_channels,
+            conv = nn.Conv1d(
+                in_channels=in_channels * hidden_size,
                 out_channels=out_channels,
-                kernel_size=(ks, hidden_size),
+                kernel_size=ks,
                 stride=1)
             self.convs.append(conv)
         self.linear = nn.Linear(out_channels*len(kernel_sizes), 1)
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved when the kernels were (ks, hidden_size) Conv2d
+        for index in range(len(self.convs)):
+            key = '{0}convs.{1}.weight'.format(prefix, index)
+            if key in state_dict and state_dict[key].dim() == 4:
+                state_dict[key] = conv2dToConv1dWeight(state_dict[key])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x):
         """
         Args:
         x -- (batch_size, in_channels=1, seq_len, hidden_size)
             = (1, 1, seq_length (max_length for professor), hidden_size)
         """
+        # (batch_size, in_channels * hidden_size, seq_len)
+        x = x.transpose(2, 3).flatten(1, 2)
+        # max-over-time pooling, before the (monotonic) activation
         x = [
-            F.leaky_relu(conv(x), negative_slope=0.01).squeeze(3)
+            F.leaky_relu(conv(x).amax(2), negative_slope=0.01)
             for conv in self.convs]
-        x = [
-            F.max_pool1d(i, i.size(2)).squeeze(2) for i in x]
 
         x = torch.cat(x, 1)
         x = self.dropoutLayer(x)
         x = self.linear(x)
 
         return x
+
+
+class DiscriminatorBank(nn.ModuleList):
+    """
+    The discriminators of all the styles, evaluated together by a single
+    grouped convolution over every style and kernel size.
+    Each discriminator is still a Cnn with its own parameters, so that
+    bank[style] can be loaded, used and optimized one by one as before.
+    The grouped convolution is computed as one batched matrix product,
+    with one group per style, of the hidden states by the rows of every
+    kernel, whose products are then summed along the time axis.
+    """
+
+    def __init__(self, numStyles, in_channels, out_channels, kernel_sizes,
+                 hidden_size, dropout):
+        """
+        Args:
+        numStyles -- the number of discriminators, one for each style
+        the other arguments are the ones of Cnn
+        """
+        super().__init__([
+            Cnn(in_channels, out_channels, kernel_sizes, hidden_size, dropout)
+            for _ in range(numStyles)])
+        self.kernel_sizes = list(kernel_sizes)
+
+    def _groupedWeights(self):
+        """
+        Output:
+        weight -- (num_styles, hidden_size, sum(kernel_sizes) * out_channels)
+                  the rows of all the kernels of each style
+        bias -- (num_styles, len(kernel_sizes) * out_channels)
+        """
+        weights = []
+        biases = []
+        for cnn in self:
+            # (out_channels, hidden, ks) -> (hidden, ks * out_channels)
+            weights.append(torch.cat([
+                conv.weight.permute(1, 2, 0).reshape(
+                    conv.weight.shape[1], -1)
+                for conv in cnn.convs], 1))
+            biases.append(torch.cat([conv.bias for conv in cnn.convs]))
+        return torch.stack(weights), torch.stack(biases)
+
+    def forward(self, x):
+        """
+        Args:
+        x -- (num_styles, batch_size, seq_len, hidden_size), where x[s] is
+             the input of the discriminator of style s
+        Output:
+        the logits (num_styles, batch_size, 1), the same of
+        self[s](x[s].unsqueeze(1)) for every style s
+        """
+        numStyles, batchSize, seqLen, hiddenSize = x.shape
+        weight, bias = self._groupedWeights()
+        # products[s, b, t, r] is the product of the hidden state t by
+        # the row r of all the kernels of style s
+        products = torch.bmm(x.reshape(numStyles, -1, hiddenSize), weight)
+        products = products.view(
+            numStyles, batchSize, seqLen, sum(self.kernel_sizes), -1)
+
+        pooled = []
+        row = 0
+        for ks in self.kernel_sizes:
+            # the response of the kernel at time t is the sum of the
+            # products of its row j by the hidden state t + j
+            numPositions = seqLen - ks + 1
+            response = products[:, :, :numPositions, row]
+            for j in range(1, ks):
+                response = response + \
+                    products[:, :, j:j + numPositions, row + j]
+            row += ks
+            # max-over-time pooling, the bias and the (monotonic)
+            # activation are applied after it
+            pooled.append(response.amax(2))
+        x = F.leaky_relu(
+            torch.cat(pooled, 2) + bias[:, None, :], negative_slope=0.01)
+
+        x = F.dropout(x, self[0].dropoutLayer.p, self.training)
+        linearWeight = torch.stack([cnn.linear.weight for cnn in self])
+        linearBias = torch.stack([cnn.linear.bias for cnn in self])
+        return torch.einsum('sbf,sof->sbo', x, linearWeight) + \
+            linearBias[:, None, :]
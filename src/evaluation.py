@@ -0,0 +1,72 @@
+"""
+Validation sets encoded once, to be evaluated at every epoch
+"""
+import random
+from collections import defaultdict
+import torch
+from src import execution
+from src.generate_batches import IdBatch, batchToIds
+
+
+class EvaluationSet(object):
+    """
+    A list of (sentences, labels) batches whose sentences are turned into
+    tensors of ids only once, on the device of the model.
+    Iterating yields (IdBatch, labels) pairs, while the sentences are kept
+    for the decoders.
+    """
+
+    def __init__(self, batches, word2id):
+        self.word2id = word2id
+        self.sentences = [list(batch[0]) for batch in batches]
+        self.labels = [list(batch[1]) for batch in batches]
+        self.batches = []
+        for sentences, labels in zip(self.sentences, self.labels):
+            ids, lengths = batchToIds(sentences, word2id)
+            self.batches.append((IdBatch(
+                torch.from_numpy(ids).to(execution.device),
+                torch.from_numpy(lengths)), labels))
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __getitem__(self, index):
+        """
+        The sentences and the labels of the batch at position index
+        """
+        return self.sentences[index], self.labels[index]
+
+    def subsample(self, size, seed=0):
+        """
+        A fixed sample of about size sentences, with the same proportion of
+        each label as the whole set, in batches of about the same size.
+        Every batch has sentences of every style, so that the losses of each
+        style are defined: a style with few sentences gets at least one per
+        batch, and there are no more batches than its sentences.
+        """
+        byLabel = defaultdict(list)
+        for sentences, labels in zip(self.sentences, self.labels):
+            for sentence, label in zip(sentences, labels):
+                byLabel[label].append(sentence)
+        total = sum(len(x) for x in byLabel.values())
+        groupSizes = {
+            label: min(len(group), round(size * len(group) / total))
+            for label, group in byLabel.items()}
+        batchSize = max(len(x) for x in self.labels)
+        numBatches = max(1, min(
+            -(-sum(groupSizes.values()) // batchSize),
+            *(len(group) for group in byLabel.values())))
+        rng = random.Random(seed)
+        batches = [([], []) for _ in range(numBatches)]
+        for label in sorted(byLabel):
+            group = byLabel[label]
+            groupSize = min(len(group), max(groupSizes[label], numBatches))
+            # the sentences of the style are spread evenly across the batches
+            for i, sentence in enumerate(rng.sample(group, groupSize)):
+                sentences, labels = batches[i * numBatches // groupSize]
+                sentences.append(sentence)
+                labels.append(label)
+        return EvaluationSet(batches, self.word2id)
@@ -0,0 +1,52 @@
+"""
+Process-wide execution settings of training and inference
+"""
+import logging
+import torch
+
+# the device of the models and of their inputs, set by configureDevice
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def configureDevice(name):
+    """
+    Run the models on the device name, e.g. "cpu" or "cuda:1", the empty
+    name picks cuda when available. It should be called before building
+    the model. Returns the device.
+    """
+    global device
+    if name:
+        device = torch.device(name)
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    logging.info('Device: {0}'.format(device))
+    return device
+
+
+def configureCpu(cpuParams):
+    """
+    Set the threads used by torch on CPU. It should be called before
+    building the model, since the inter-op thread pool can not be resized
+    once it has been used.
+    """
+    if cpuParams.num_threads > 0:
+        torch.set_num_threads(cpuParams.num_threads)
+    if cpuParams.num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(cpuParams.num_interop_threads)
+        except RuntimeError as e:
+            logging.warning('Inter-op threads not set: {0}'.format(e))
+    if cpuParams.flush_denormal and not torch.set_flush_denormal(True):
+        logging.warning('Flushing denormals is not supported on this CPU')
+    logging.info('CPU threads: intra-op {0}, inter-op {1}'.format(
+        torch.get_num_threads(), torch.get_num_interop_threads()))
+
+
+def autocast(params):
+    """
+    Context running the forward passes in bfloat16 if params.bf16_autocast,
+    while the parameters are kept in float32
+    """
+    return torch.autocast(
+        device_type=device.type, dtype=torch.bfloat16,
+        enabled=params.bf16_autocast)
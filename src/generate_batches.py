@@ -1,34 +1,226 @@
 import copy
+import logging
+import random
 from sklearn.utils import shuffle
 import numpy as np
+from collections import namedtuple
 
 
-def batchesFromFiles(style1, style2, batchsize, inMemory):
+def batchesFromFiles(
+        style1, style2, batchsize, inMemory, bufferSize=10000, bucketSize=0):
+    if inMemory and bucketSize > 0:
+        return BucketedBatches(
+            [readStyleFile(style1), readStyleFile(style2)],
+            batchsize, bucketSize)
     if inMemory:
         return loadFilesAndGenerateBatches(
             style1, style2, batchsize)
 
-    return yieldBatchesFromFiles(style1, style2, batchsize)
+    if bucketSize > 0:
+        logging.warning(
+            'Length bucketing is not supported when the files are not '
+            'loaded in memory, bucket_size is ignored')
+    return StreamingBatches([style1, style2], batchsize, bufferSize)
 
 
-def yieldBatchesFromFiles(files, batchsize):
+class StreamingBatches(object):
     """
-    Generate batches without loading files in memory
+    Generate balanced batches without loading files in memory.
+    Every iteration over the object is an epoch: the lines of each style
+    file are shuffled through a bounded buffer of bufferSize lines, and each
+    batch takes batchsize // len(files) lines per style. An epoch ends when
+    the longest file is exhausted, while the shorter files are read again
+    (with a different shuffle) whenever they run out of lines.
     """
-    openedFiles = []
-    for fname in files:
-        openedFiles.append(open(fname, 'r'))
 
-    while True:
+    def __init__(self, files, batchsize, bufferSize=10000, seed=None):
+        self.files = files
+        self.iterStep = batchsize // len(files)
+        if bufferSize <= 1:
+            # e.g. shuffle_buffer_size missing from the parameters
+            logging.warning(
+                'Shuffle buffer of {0} lines: the streamed lines are not '
+                'shuffled'.format(bufferSize))
+        self.bufferSize = max(bufferSize, 1)
+        self.rng = random.Random(seed)
+        # the state of rng at the beginning of the current epoch
+        self.epochState = self.rng.getstate()
+        self.numLines = None
+
+    @staticmethod
+    def _readLines(fileName):
+        with open(fileName, 'r') as fp:
+            for line in fp:
+                # remove final '\n'
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+
+    def _shuffledLines(self, fileName):
+        """
+        Endless stream of the lines of fileName, shuffled through a buffer.
+        Raises ValueError if fileName has no lines.
+        """
+        buffer = []
+        while True:
+            empty = True
+            for line in self._readLines(fileName):
+                empty = False
+                if len(buffer) < self.bufferSize:
+                    buffer.append(line)
+                    continue
+                index = self.rng.randrange(self.bufferSize)
+                yield buffer[index]
+                buffer[index] = line
+
+            if empty:
+                raise ValueError(fileName)
+            self.rng.shuffle(buffer)
+            while buffer:
+                yield buffer.pop()
+
+    def shuffle(self):
+        # lines are shuffled by the buffer at every iteration
+        pass
+
+    def state_dict(self):
+        # iterating after load_state_dict repeats the current epoch
+        return {'rng': self.epochState}
+
+    def load_state_dict(self, state):
+        self.rng.setstate(state['rng'])
+        self.epochState = state['rng']
+
+    def __len__(self):
+        if self.numLines is None:
+            self.numLines = [
+                sum(1 for _ in self._readLines(fileName))
+                for fileName in self.files]
+        return max(self.numLines) // self.iterStep
+
+    def __iter__(self):
+        self.epochState = self.rng.getstate()
+        streams = [self._shuffledLines(fileName) for fileName in self.files]
+        for _ in range(len(self)):
+            inputs = []
+            labels = []
+            for label, stream in enumerate(streams):
+                for _ in range(self.iterStep):
+                    inputs.append(next(stream))
+                    labels.append(label)
+
+            yield inputs, labels
+        # the next epoch starts from here
+        self.epochState = self.rng.getstate()
+
+
+def readStyleFile(fileName):
+    with open(fileName, 'r') as fp:
+        lines = fp.readlines()
+
+    lines = list(map(lambda x: x[:-1], lines))
+    # the last line is always an empty line
+    return lines[:-1]
+
+
+def paddingRatio(batchLengths):
+    """
+    Fraction of the tokens fed to the networks which are '<pad>', given
+    the sentence lengths of each batch. Every sentence is padded to the
+    longest one of its batch, '<eos>' included.
+    """
+    padded = 0
+    real = 0
+    for lengths in batchLengths:
+        lengths = np.asarray(lengths) + 1
+        padded += lengths.max() * len(lengths)
+        real += lengths.sum()
+    if padded == 0:
+        return 0.0
+    return 1.0 - real / padded
+
+
+def sentenceLengths(sentences):
+    if hasattr(sentences, 'lengths'):
+        # compiled corpora already know the length of their sentences
+        return np.asarray(sentences.lengths)
+    return np.array([x.count(" ") + 1 for x in sentences])
+
+
+class BucketedBatches(object):
+    """
+    Balanced batches made of sentences of similar length, to reduce
+    the padding added by preprocessSentences.
+    At every epoch the sentences of each style are shuffled and split in
+    pools of bucketSize half batches; each pool is sorted by length and
+    cut into half batches. Half batches of the two styles with the same
+    length rank are then paired, so that every batch keeps the 50/50 style
+    balance, and the order of the batches is shuffled.
+    """
+
+    def __init__(self, styles, batchsize, bucketSize=100, seed=None):
+        """
+        Args:
+        styles -- for each style, a sequence of sentences: either a list of
+                  strings or a CompiledCorpus
+        """
+        self.styles = styles
+        self.lengths = [sentenceLengths(x) for x in styles]
+        self.iterStep = batchsize // len(styles)
+        self.poolSize = bucketSize * self.iterStep
+        self.rng = np.random.RandomState(seed)
+        self.numBatches = min(map(len, styles)) // self.iterStep
+        self.batches = None
+        self.paddingRatio = None
+
+    def _halfBatches(self, lengths):
+        indices = self.rng.permutation(len(lengths))
+        indices = indices[:len(indices) - len(indices) % self.iterStep]
+        for start in range(0, len(indices), self.poolSize):
+            pool = indices[start:start + self.poolSize]
+            # stable sort, so that ties keep their random order
+            pool = pool[np.argsort(lengths[pool], kind='stable')]
+            indices[start:start + self.poolSize] = pool
+        halves = indices.reshape(-1, self.iterStep)
+        # keep numBatches half batches, sorted by their padded length
+        halves = halves[self.rng.permutation(len(halves))[:self.numBatches]]
+        return halves[np.argsort(lengths[halves].max(1), kind='stable')]
+
+    def shuffle(self):
+        halves = [self._halfBatches(x) for x in self.lengths]
+        self.batches = np.stack(halves, axis=1)
+        self.rng.shuffle(self.batches)
+        self.paddingRatio = paddingRatio(
+            np.concatenate([lengths[x] for lengths, x in zip(
+                self.lengths, batch)])
+            for batch in self.batches)
+        logging.info('Padding ratio of the bucketed batches: {0:.4f}'.format(
+            self.paddingRatio))
+
+    def state_dict(self):
+        return {'batches': self.batches, 'rng': self.rng.get_state()}
+
+    def load_state_dict(self, state):
+        self.batches = state['batches']
+        self.rng.set_state(state['rng'])
+
+    def __len__(self):
+        return self.numBatches
+
+    def __getitem__(self, index):
+        if self.batches is None:
+            self.shuffle()
         inputs = []
         labels = []
-        for label, fp in enumerate(openedFiles):
-            for i in range(batchsize // len(files)):
-                # remove final '\n'
-                inputs.append(fp.readline()[:-1])
-                labels.append(label)
+        for label, (sentences, indices) in enumerate(
+                zip(self.styles, self.batches[index])):
+            inputs.extend(sentences[i] for i in indices)
+            labels.extend([label] * len(indices))
+        return inputs, labels
 
-        yield inputs, labels
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
 
 
 def loadFilesAndGenerateBatches(
@@ -36,12 +228,7 @@ def loadFilesAndGenerateBatches(
     inputs = []
     lenLines = []
     for label, fileName in enumerate([style1, style2]):
-        with open(fileName, 'r') as fp:
-            lines = fp.readlines()
-
-        lines = list(map(lambda x: x[:-1], lines))
-        # the last line is always an empty line
-        lines = lines[:-1]
+        lines = readStyleFile(fileName)
         lenLines.append(len(lines))
         if shuffleFiles:
             lines = shuffle(lines)
@@ -70,12 +257,11 @@ def loadFilesAndGenerateBatches(
     return batches
 
 
-def noise(sentences, word_drop=0.0, k=3):
+def noise(sentences, word_drop=0.0, k=3, unk='<unk>'):
     """
     Apply noise to input sentences as suggested in the paper:
     Unsupervised Machine Translation Using Monolingual Corpora Only
     """
-    unk = '<unk>'
     for sentIndex, sent in enumerate(sentences):
         sentLen = len(sent)
         for wordIndex in range(sentLen):
@@ -94,25 +280,103 @@ def noise(sentences, word_drop=0.0, k=3):
     return sentences
 
 
+def noiseIds(ids, lengths, word_drop=0.0, k=3, unk=3):
+    """
+    Batch version of noise, working on a padded matrix of ids.
+    Args:
+    ids -- (batch_size, max_len) array of ids, padded after lengths
+    lengths -- (batch_size,) number of words of each sentence
+    unk -- the id of '<unk>'
+    Output:
+    a new (batch_size, max_len) array with the same distribution of noise
+    of noise(), the padding is left untouched
+    """
+    batchSize, maxLen = ids.shape
+    positions = np.arange(maxLen)
+    isWord = positions[None, :] < np.asarray(lengths)[:, None]
+    # drop words from input with probability word-drop
+    dropped = (np.random.random_sample(ids.shape) < word_drop) & isWord
+    ids = np.where(dropped, unk, ids)
+    # the same k-bounded permutation of noise(), where padding positions
+    # get an infinite key to stay at the end of the sentence
+    noisyIndexes = positions + (k+1) * np.random.rand(batchSize, maxLen)
+    noisyIndexes[~isWord] = np.inf
+    sigma = noisyIndexes.argsort(axis=1)
+    return np.take_along_axis(ids, sigma, axis=1)
+
+
+# a batch already turned into ids by batchToIds
+IdBatch = namedtuple('IdBatch', ['ids', 'lengths'])
+
+
+def batchToIds(sentences, word2id, noisy=False, word_drop=0.0):
+    """
+    Turn a batch of sentences into a single padded matrix of ids, without
+    sorting the sentences and without intermediate lists of tokens.
+    Args:
+    sentences -- a list of strings or a list of arrays of ids
+    word2id -- the word -> id mapping of the vocabulary
+    Output:
+    ids -- (batch_size, max_len + 2) int64 array whose rows are
+           '<go>' w_1 ... w_n '<eos>' '<pad>' ... '<pad>'
+           so that ids[:, 1:] are the encoder inputs and the targets and
+           ids[:, :-1] are the generator inputs
+    lengths -- (batch_size,) int64 array of n + 1
+    """
+    go, eos, pad, unk = [
+        word2id[x] for x in ['<go>', '<eos>', '<pad>', '<unk>']]
+    if isinstance(sentences[0], str):
+        words = " ".join(sentences).split(" ")
+        wordLengths = np.array(
+            [x.count(" ") + 1 for x in sentences], dtype=np.int64)
+        flat = np.fromiter(
+            (word2id.get(x, unk) for x in words),
+            dtype=np.int64, count=len(words))
+    else:
+        wordLengths = np.array(list(map(len, sentences)), dtype=np.int64)
+        flat = np.concatenate(sentences)
+
+    batchSize = len(sentences)
+    maxLen = wordLengths.max()
+    isWord = np.arange(maxLen)[None, :] < wordLengths[:, None]
+    words = np.full((batchSize, maxLen), pad, dtype=np.int64)
+    words[isWord] = flat
+    if noisy:
+        words = noiseIds(words, wordLengths, word_drop, unk=unk)
+
+    ids = np.full((batchSize, maxLen + 2), pad, dtype=np.int64)
+    ids[:, 0] = go
+    ids[:, 1:-1] = words
+    ids[np.arange(batchSize), wordLengths + 1] = eos
+    return ids, wordLengths + 1
+
+
 def preprocessSentences(
-        sentences, padToMaxLen=True, noisy=False, word_drop=0.0):
+        sentences, padToMaxLen=True, noisy=False, word_drop=0.0,
+        specialTokens=('<go>', '<eos>', '<pad>', '<unk>')):
+    """
+    specialTokens -- the (go, eos, pad, unk) tokens, their ids when
+                     sentences are lists of ids
+    """
+    go, eos, pad, unk = specialTokens
+
     def addGo(sentence):
-        out = ['<go>']
+        out = [go]
         out.extend(sentence)
         return out
 
     def addEos(sentence):
-        sentence.append('<eos>')
+        sentence.append(eos)
         return sentence
 
     def addPad(sentence, maxLen):
         currLen = len(sentence)
-        sentence.extend(['<pad>'] * (maxLen - currLen))
+        sentence.extend([pad] * (maxLen - currLen))
         return sentence
 
     sentences = sorted(sentences, key=len, reverse=True)
     if noisy:
-        sentences = noise(sentences, word_drop)
+        sentences = noise(sentences, word_drop, unk=unk)
     encoder_inputs = copy.deepcopy(sentences)
     encoder_inputs = [addEos(x) for x in encoder_inputs]
     decoder_inputs = copy.deepcopy(sentences)
@@ -1,31 +1,63 @@
 import torch
+from src.decoder import Decoder
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-
-class GreedyDecoder(object):
+class GreedyDecoder(Decoder):
 
     def __init__(self, styleTransfer, params):
-        self.model = styleTransfer
+        super().__init__(styleTransfer, params)
         self.max_len = params.max_len
-        self.params = params
 
-    def _decode(self, h0s):
-        batch_size = h0s.shape[1]
-        hiddens, tokens = self.model._generateWithPrevOutput(
-            h0s, self.max_len, evaluation=True, soft=False)
-        sentences = []
-        for i in range(batch_size):
-            curr = tokens[i, :]
-            sent = [self.model.vocabulary.id2word[int(x)] for x in list(curr)]
-            sentences.append(" ".join(sent))
-        return sentences
+    def _greedySearch(self, h0s):
+        """
+        Generate the most probable word at each step, until every sentence
+        has generated <eos> or max_len words. The finished sentences are
+        dropped from the batch, so that later steps run on fewer rows.
+        Args:
+        h0s -- the first hidden states (num_layers, batch_size, hidden_size)
+        Output:
+        ids -- (batch_size, max_len) the words of each sentence, in its
+               first lengths[i] columns
+        lengths -- (batch_size) the number of words before <eos>
+        """
+        batchSize = h0s.shape[1]
+        word2id = self.model.vocabulary.word2id
+        eos = word2id['<eos>']
+        if self.params.decode_loop:
+            # the compiled loops always generate max_len words
+            _, sentences = self.model._generateWithPrevOutput(
+                h0s, self.max_len, evaluation=True, soft=False)
+            isEos = sentences == eos
+            lengths = torch.where(
+                isEos.any(1), isEos.int().argmax(1), self.max_len)
+            return sentences, lengths
 
-    def rewriteBatch(self, sentences, labels):
-        self.model.transformBatch(sentences, labels)
-        originalHiddens = self.model.originalHiddens
-        transformedHiddens = self.model.transformedHiddens
-        original = self._decode(originalHiddens)
-        transformed = self._decode(transformedHiddens)
+        hidden = h0s
+        ids = torch.full(
+            (batchSize,), word2id['<go>'], dtype=torch.long,
+            device=h0s.device)
+        sentences = torch.full(
+            (batchSize, self.max_len), word2id['<pad>'], dtype=torch.long,
+            device=h0s.device)
+        lengths = torch.full(
+            (batchSize,), self.max_len, dtype=torch.long, device=h0s.device)
+        # the rows of the batch still being decoded
+        active = torch.arange(batchSize, device=h0s.device)
+        for step in range(self.max_len):
+            embs = self.model.vocabulary(ids, byWord=False).unsqueeze(1)
+            _, hidden = self.model.generator(embs, hidden, pad=False)
+            ids = self.model._mostProbableWords(hidden[-1])
+            sentences[active, step] = ids
+            finished = ids == eos
+            if finished.any():
+                lengths[active[finished]] = step
+                alive = ~finished
+                if not alive.any():
+                    break
+                active, ids = active[alive], ids[alive]
+                hidden = hidden[:, alive]
+        return sentences, lengths
 
-        return original, transformed
+    def _decodeSentences(self, h0s):
+        sentences, lengths = self._greedySearch(h0s)
+        return self.model.vocabulary.idsToSentences(sentences, lengths)
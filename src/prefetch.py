@@ -0,0 +1,136 @@
+"""
+Prepare the training batches in background worker processes
+"""
+import collections
+import itertools
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from src.generate_batches import IdBatch, batchToIds
+
+# state of each worker process, set by _initWorker
+_word2id = None
+_noisy = False
+_wordDrop = 0.0
+
+
+def _initWorker(word2id, noisy, wordDrop):
+    global _word2id, _noisy, _wordDrop
+    _word2id, _noisy, _wordDrop = word2id, noisy, wordDrop
+    # workers only run numpy code, one thread each is enough
+    torch.set_num_threads(1)
+
+
+def _prepareBatch(sentences, labels, seed):
+    # the noise of a batch only depends on its seed,
+    # not on the worker which prepares it
+    np.random.seed(seed)
+    ids, lengths = batchToIds(
+        sentences, _word2id, noisy=_noisy, word_drop=_wordDrop)
+    # tensors are sent back to the main process through shared memory
+    return IdBatch(torch.from_numpy(ids), torch.from_numpy(lengths)), labels
+
+
+class BatchPrefetcher(object):
+    """
+    Wraps a collection of (sentences, labels) batches and yields
+    (IdBatch, labels) pairs, prepared by numWorkers processes up to
+    prefetch batches ahead of the training loop.
+    The noise applied to the batch at position i of epoch e only depends on
+    (seed, e, i), so epochs are reproducible for any number of workers.
+    """
+
+    def __init__(
+            self, batches, word2id, noisy=True, word_drop=0.0,
+            numWorkers=2, prefetch=8, seed=0):
+        self.batches = batches
+        self.word2id = word2id
+        self.noisy = noisy
+        self.word_drop = word_drop
+        self.numWorkers = numWorkers
+        self.prefetch = max(prefetch, 1)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.epoch = 0
+        # the order of the batches, when they are a list
+        self.order = list(range(len(batches))) \
+            if isinstance(batches, list) else None
+        # created by the first epoch and kept for the following ones
+        self.pool = None
+
+    def shuffle(self):
+        if isinstance(self.batches, list):
+            self.rng.shuffle(self.order)
+        else:
+            self.batches.shuffle()
+
+    def state_dict(self):
+        state = {'epoch': self.epoch, 'rng': self.rng.getstate()}
+        if isinstance(self.batches, list):
+            state['order'] = self.order
+        else:
+            state['batches'] = self.batches.state_dict()
+        return state
+
+    def load_state_dict(self, state):
+        self.epoch = state['epoch']
+        self.rng.setstate(state['rng'])
+        if isinstance(self.batches, list):
+            self.order = state['order']
+        else:
+            self.batches.load_state_dict(state['batches'])
+
+    def __len__(self):
+        return len(self.batches)
+
+    def _batchSeed(self, index):
+        sequence = np.random.SeedSequence([self.seed, self.epoch, index])
+        return int(sequence.generate_state(1)[0])
+
+    def _getPool(self):
+        if self.pool is None:
+            # forking a process which already runs torch threads can
+            # deadlock the children, workers are spawned instead
+            context = mp.get_context('spawn')
+            self.pool = context.Pool(
+                self.numWorkers, initializer=_initWorker,
+                initargs=(self.word2id, self.noisy, self.word_drop))
+        return self.pool
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __del__(self):
+        if getattr(self, 'pool', None) is not None:
+            self.close()
+
+    def __iter__(self):
+        return self.iterFrom(0)
+
+    def iterFrom(self, start):
+        """
+        Iterate over the batches of the epoch from the one at position start,
+        without preparing the previous ones
+        """
+        if isinstance(self.batches, list):
+            batches = (self.batches[i] for i in self.order[start:])
+        else:
+            batches = itertools.islice(self.batches, start, None)
+        pending = collections.deque()
+        pool = self._getPool()
+        for index, (sentences, labels) in enumerate(batches, start):
+            pending.append(pool.apply_async(
+                _prepareBatch,
+                (sentences, labels, self._batchSeed(index))))
+            if len(pending) >= self.prefetch:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        self.epoch += 1
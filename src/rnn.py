@@ -1,7 +1,7 @@
+from typing import List, Tuple
 import torch
 from torch import nn
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+import torch.nn.functional as F
 
 
 class Rnn(nn.Module):
@@ -28,7 +28,8 @@ class Rnn(nn.Module):
 
         if pad:
             inputs = nn.utils.rnn.pack_padded_sequence(
-                inputs, lengths, batch_first=self.batch_first)
+                inputs, lengths, batch_first=self.batch_first,
+                enforce_sorted=False)
 
         output, hidden = self.cell(inputs, hidden)
 
@@ -39,24 +40,126 @@ class Rnn(nn.Module):
         return output, hidden
 
 
-def SoftSampleWord(dropout, embeddings, gamma):
+def SoftSampleWord(dropout, embeddings, gamma, topK=0):
     """
     Given the output of the generator, performs a dropout over it
-    and then apply the Gumbel_softmax trick
+    and then apply the Gumbel_softmax trick.
+    If topK > 0 only the topK most probable words are sampled, and the
+    current token mixes only their embeddings.
     """
     def GumbelSoftmax(logits, gamma, eps=1e-20):
-        U = torch.rand(logits.shape).to(device)
+        U = torch.rand_like(logits)
         G = -torch.log(-torch.log(U + eps) + eps)
         return nn.functional.softmax(
             (logits + G) / gamma, dim=1)  # log(logits) is better???
 
     def loop_func(output, hiddenToVocab):
-        drop = nn.Dropout(p=dropout)
-        out = drop(output)
+        # the dropout is applied during both training and test
+        out = F.dropout(output, p=dropout, training=True)
         vocabLogits = hiddenToVocab(out[:, 0, :])
+        if topK > 0:
+            topLogits, topIds = vocabLogits.topk(topK, dim=1)
+            topProbs = GumbelSoftmax(topLogits, gamma)
+            currTokens = torch.bmm(
+                topProbs.unsqueeze(1), embeddings(topIds)).squeeze(1)
+            return currTokens, vocabLogits
         vocabProbs = GumbelSoftmax(vocabLogits, gamma)
         currTokens = torch.matmul(
             vocabProbs, embeddings.weight)
         return currTokens, vocabLogits
 
     return loop_func
+
+
+def _gruCell(x, h, w_ih, w_hh, b_ih, b_hh):
+    # same equations of nn.GRU, gates ordered as (reset, update, new)
+    gi = torch.addmm(b_ih, x, w_ih.t())
+    gh = torch.addmm(b_hh, h, w_hh.t())
+    i_r, i_z, i_n = gi.chunk(3, 1)
+    h_r, h_z, h_n = gh.chunk(3, 1)
+    r = torch.sigmoid(i_r + h_r)
+    z = torch.sigmoid(i_z + h_z)
+    n = torch.tanh(i_n + r * h_n)
+    return n + z * (h - n)
+
+
+def _gumbelSoftmax(logits, gamma: float):
+    # the GumbelSoftmax of SoftSampleWord
+    eps = 1e-20
+    U = torch.rand_like(logits)
+    G = -torch.log(-torch.log(U + eps) + eps)
+    return F.softmax((logits + G) / gamma, dim=1)
+
+
+def professorForcingLoop(
+        h0: torch.Tensor, goEmbedding: torch.Tensor,
+        gruWeights: List[torch.Tensor], outWeight: torch.Tensor,
+        outBias: torch.Tensor, embeddings: torch.Tensor, steps: int,
+        soft: bool, inputDropout: float, outputDropout: float, gamma: float,
+        training: bool, topK: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    The generation loop of StyleTransfer._generateWithPrevOutput written
+    with GRU cell equations, so that it can be compiled as a whole.
+    Args:
+    h0 -- (num_layers, batch_size, hidden_size)
+    goEmbedding -- (batch_size, embedding_size)
+    gruWeights -- weight_ih, weight_hh, bias_ih, bias_hh of each layer
+    outWeight, outBias -- the hiddenToVocab Linear layer
+    embeddings -- the (vocab_size, embedding_size) embedding matrix
+    topK -- if > 0, soft tokens only mix the topK most probable words
+    Output:
+    hiddens -- (batch_size, steps + 1, hidden_size), starting with h0
+    tokens -- the soft tokens (batch_size, steps, embedding_size) if soft,
+              else the ids of the most probable words (batch_size, steps)
+    """
+    hidden = [h0[i] for i in range(h0.shape[0])]
+    hiddens = [h0[-1]]
+    tokens = []
+    currTokens = goEmbedding
+    for _ in range(steps):
+        x = F.dropout(currTokens, inputDropout, training)
+        for layer in range(len(hidden)):
+            x = _gruCell(
+                x, hidden[layer], gruWeights[4 * layer],
+                gruWeights[4 * layer + 1], gruWeights[4 * layer + 2],
+                gruWeights[4 * layer + 3])
+            hidden[layer] = x
+        hiddens.append(x)
+        if soft:
+            # the sampling of SoftSampleWord
+            out = F.dropout(x, outputDropout, True)
+            logits = F.linear(out, outWeight, outBias)
+            if topK > 0:
+                topLogits, topIds = logits.topk(topK, dim=1)
+                probs = _gumbelSoftmax(topLogits, gamma)
+                currTokens = torch.bmm(
+                    probs.unsqueeze(1),
+                    F.embedding(topIds, embeddings)).squeeze(1)
+            else:
+                probs = _gumbelSoftmax(logits, gamma)
+                currTokens = torch.matmul(probs, embeddings)
+            tokens.append(currTokens)
+        else:
+            idxs = F.linear(x, outWeight, outBias).argmax(1)
+            currTokens = F.embedding(idxs, embeddings)
+            tokens.append(idxs)
+    return torch.stack(hiddens, 1), torch.stack(tokens, 1)
+
+
+# compiled versions of professorForcingLoop, built when first needed
+_compiledLoops = {}
+
+
+def compiledProfessorForcingLoop(backend):
+    """
+    backend -- 'script' for TorchScript or 'compile' for torch.compile
+    """
+    if backend not in _compiledLoops:
+        if backend == 'script':
+            _compiledLoops[backend] = torch.jit.script(professorForcingLoop)
+        elif backend == 'compile':
+            _compiledLoops[backend] = torch.compile(
+                professorForcingLoop, dynamic=True)
+        else:
+            raise ValueError('Unknown decode loop {0}'.format(backend))
+    return _compiledLoops[backend]
@@ -0,0 +1,170 @@
+"""
+Style transfer of single sentences, grouped into micro-batches
+"""
+import asyncio
+import bisect
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from src.decoder import TRANSFER
+
+
+class Histogram(object):
+    """
+    Counts of the observed values in the buckets (-inf, bounds[0]],
+    (bounds[0], bounds[1]], ..., (bounds[-1], +inf), written in the
+    Prometheus text format
+    """
+
+    def __init__(self, name, description, bounds):
+        self.name = name
+        self.description = description
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def lines(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.description),
+            '# TYPE {0} histogram'.format(self.name)]
+        cumulative = 0
+        for bound, count in zip(self.bounds + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append('{0}_bucket{{le="{1}"}} {2}'.format(
+                self.name, bound, cumulative))
+        lines.append('{0}_sum {1}'.format(self.name, self.sum))
+        lines.append('{0}_count {1}'.format(self.name, cumulative))
+        return lines
+
+
+def _powersOfTwo(maximum):
+    bounds = [1]
+    while bounds[-1] < maximum:
+        bounds.append(2 * bounds[-1])
+    return bounds
+
+
+class MicroBatcher(object):
+    """
+    Collect the concurrent transfer requests into batches of at most
+    maxBatchSize sentences, waiting at most maxDelay seconds after the
+    first request of a batch for the others. Batches are decoded one at a
+    time in a worker thread, while the next one is being collected.
+    """
+
+    def __init__(self, decoder, maxBatchSize, maxDelay):
+        """
+        Args:
+        decoder -- a GreedyDecoder or a BeamSearchDecoder
+        maxDelay -- in seconds
+        """
+        self.decoder = decoder
+        self.maxBatchSize = maxBatchSize
+        self.maxDelay = maxDelay
+        # created here, so that requests can be queued before run starts
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queueDepth = Histogram(
+            'transfer_queue_depth',
+            'Requests waiting in the queue when a request arrives',
+            [0] + _powersOfTwo(4 * maxBatchSize))
+        self.batchSize = Histogram(
+            'transfer_batch_size', 'Sentences of each decoded batch',
+            _powersOfTwo(maxBatchSize))
+        self.batchSeconds = Histogram(
+            'transfer_batch_seconds', 'Time to decode a batch',
+            [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+        self.latency = Histogram(
+            'transfer_request_seconds',
+            'Time from the arrival of a request to its response',
+            [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+
+    async def run(self):
+        """
+        Form and decode the batches, until cancelled
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.maxDelay
+            while len(batch) < self.maxBatchSize:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    if self.queue.empty():
+                        break
+                    batch.append(self.queue.get_nowait())
+                    continue
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # requests cancelled while waiting, e.g. by a closed connection
+            batch = [x for x in batch if not x[2].done()]
+            if not batch:
+                continue
+            self.batchSize.observe(len(batch))
+            start = time.perf_counter()
+            try:
+                transferred = await loop.run_in_executor(
+                    self.executor, self._transfer,
+                    [x[0] for x in batch], [x[1] for x in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.batchSeconds.observe(time.perf_counter() - start)
+            for (_, _, future), sentence in zip(batch, transferred):
+                if not future.done():
+                    future.set_result(sentence)
+
+    def _transfer(self, sentences, labels):
+        with torch.inference_mode():
+            return self.decoder.rewriteBatch(
+                sentences, labels, mode=TRANSFER)[1]
+
+    async def transfer(self, sentence, style):
+        """
+        Rewrite sentence in the style style (0 or 1)
+        """
+        return (await self.transferAll([sentence], style))[0]
+
+    async def transferAll(self, sentences, style):
+        """
+        Rewrite the list sentences in the style style (0 or 1).
+        Raises ValueError if there are more than maxBatchSize sentences.
+        """
+        if len(sentences) > self.maxBatchSize:
+            raise ValueError('at most {0} sentences per request'.format(
+                self.maxBatchSize))
+        start = time.perf_counter()
+        self.queueDepth.observe(self.queue.qsize())
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in sentences]
+        for sentence, future in zip(sentences, futures):
+            # the sentence is encoded with its current style, the opposite
+            self.queue.put_nowait((sentence, 1 - style, future))
+        try:
+            return await asyncio.gather(*futures)
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def metrics(self):
+        """
+        The histograms and the current queue depth in Prometheus text format
+        """
+        lines = [
+            '# HELP transfer_queue_length Requests waiting in the queue',
+            '# TYPE transfer_queue_length gauge',
+            'transfer_queue_length {0}'.format(self.queue.qsize())]
+        for histogram in [
+                self.queueDepth, self.batchSize, self.batchSeconds,
+                self.latency]:
+            lines.extend(histogram.lines())
+        return '\n'.join(lines) + '\n'
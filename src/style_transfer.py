@@ -1,4 +1,3 @@
-import copy
 import json
 import logging
 import numpy as np
@@ -6,21 +5,23 @@ import os
 import pickle
 import torch
 from torch import optim
+from torch.utils.checkpoint import checkpoint
 import torch.nn as nn
 import torch.nn.functional
 from collections import defaultdict
 from src.beam_search import BeamSearchDecoder
 from src.greedy_decoding import GreedyDecoder
+from src.adaptive_softmax import AdaptiveHiddenToVocab
+from src import execution
 from src.base_model import BaseModel
-from src.generate_batches import preprocessSentences
-from src.rnn import Rnn, SoftSampleWord
-from src.discriminator import Cnn
+from src.execution import autocast
+from src.generate_batches import IdBatch, batchToIds
+from src.rnn import Rnn, SoftSampleWord, compiledProfessorForcingLoop
+from src.discriminator import DiscriminatorBank
+from src.evaluation import EvaluationSet
 from src.vocabulary import Vocabulary
 
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-
 def labelFlipping(ones, flipping):
     """
     apply one-sided label flipping to positive labels as described in:
@@ -39,19 +40,26 @@ def labelSmoothing(ones, smoothing):
     apply one sided smoothing to positive labels as described in:
     Improved Techniques for Training GANs - 2016
     """
-    randVec = torch.rand(ones.shape).to(device)
+    randVec = torch.rand_like(ones)
     smoothed = ones - randVec*smoothing
     return smoothed
 
 
+def padSequence(x, length):
+    """
+    pad x of shape (batch_size, seq_len, hidden_size) with zeros
+    to (batch_size, length, hidden_size)
+    """
+    return nn.functional.pad(x, (0, 0, 0, length - x.shape[1]))
+
+
 class GaussianNoise(nn.Module):
     def __init__(self):
         super().__init__()
 
     def forward(self, din, stddev):
         if self.training:
-            noise = torch.autograd.Variable(
-                torch.randn(din.size()).to(device) * stddev)
+            noise = torch.randn_like(din) * stddev
             return din + noise
         return din
 
@@ -71,42 +79,41 @@ class StyleTransfer(BaseModel):
             self.params.autoencoder.hidden_size,
             self.params.autoencoder.num_layers,
             batch_first=True,
-            dropout=self.params.dropout).to(device)
+            dropout=self.params.dropout).to(execution.device)
         self.generator = Rnn(
             self.params.autoencoder.input_size,
             self.params.autoencoder.hidden_size,
             self.params.autoencoder.num_layers,
             batch_first=True,
-            dropout=self.params.dropout).to(device)
+            dropout=self.params.dropout).to(execution.device)
 
         # instantiating linear networks for hidden transformations
         self.encoderLabelsTransform = \
-            torch.nn.Linear(1, self.params.dim_y).to(device)
+            torch.nn.Linear(1, self.params.dim_y).to(execution.device)
         self.generatorLabelsTransform = \
-            torch.nn.Linear(1, self.params.dim_y).to(device)
-        self.hiddenToVocab = torch.nn.Linear(
-            self.params.autoencoder.hidden_size,
-            self.vocabulary.vocabSize).to(device)
-
-        # instantiating the discriminators
-        discriminator0 = Cnn(
-            self.params.discriminator.in_channels,
-            self.params.discriminator.out_channels,
-            self.params.discriminator.kernel_sizes,
-            self.params.autoencoder.hidden_size,
-            self.params.discriminator.dropout
-        ).to(device)
-        discriminator1 = Cnn(
+            torch.nn.Linear(1, self.params.dim_y).to(execution.device)
+        if self.params.adaptive_softmax_cutoffs:
+            self.hiddenToVocab = AdaptiveHiddenToVocab(
+                self.params.autoencoder.hidden_size,
+                self.vocabulary.vocabSize,
+                self.params.adaptive_softmax_cutoffs,
+                self.params.adaptive_softmax_div_value or 4.0
+            ).to(execution.device)
+        else:
+            self.hiddenToVocab = torch.nn.Linear(
+                self.params.autoencoder.hidden_size,
+                self.vocabulary.vocabSize).to(execution.device)
+
+        # instantiating the discriminators, self.discriminators[label]
+        # is the Cnn of style label
+        self.discriminators = DiscriminatorBank(
+            2,
             self.params.discriminator.in_channels,
             self.params.discriminator.out_channels,
             self.params.discriminator.kernel_sizes,
             self.params.autoencoder.hidden_size,
             self.params.discriminator.dropout
-        ).to(device)
-        self.discriminators = {
-            0: discriminator0,
-            1: discriminator1
-        }
+        ).to(execution.device)
 
         # instantiating the optimizer
         self.autoencoder_optimizer = optim.Adam(
@@ -131,41 +138,37 @@ class StyleTransfer(BaseModel):
                    self.params.discriminator.beta_1))
 
         # instantiating the loss criterion
-        self.rec_loss_criterion = nn.CrossEntropyLoss().to(device)
-        self.adv_loss_criterion = nn.BCEWithLogitsLoss().to(device)
+        self.rec_loss_criterion = nn.CrossEntropyLoss().to(execution.device)
+        self.adv_loss_criterion = nn.BCEWithLogitsLoss().to(execution.device)
 
     def adversarialLoss(self, x_real, x_fake, label, eg, noisy=True):
         # initialize target tensors for the generator and the discriminator
-        zeros = torch.zeros((len(x_fake), 1)).to(device)
-        g_ones = torch.ones((len(x_real), 1)).to(device)
-        d_ones = torch.ones((len(x_real), 1)).to(device)
-        if self.params.discriminator.l_smoothing:
-            d_ones = labelSmoothing(
-                d_ones, self.params.discriminator.l_smoothing)
-        if self.params.discriminator.l_flipping:
-            d_ones = labelFlipping(
-                d_ones, self.params.discriminator.l_flipping)
+        zeros = torch.zeros((len(x_fake), 1), device=execution.device)
+        g_ones = torch.ones((len(x_real), 1), device=execution.device)
+        d_ones = self._realTargets(len(x_real))
 
         # choose which discriminator to apply
         discriminator = self.discriminators[label]
         # prepare discriminator's inputs
+        x_real, x_fake = self._padForDiscriminator([x_real, x_fake])
         x_real = x_real.unsqueeze(1)
         x_fake = x_fake.unsqueeze(1)
         if noisy:
             x_real = self.discriminatorNoise(x_real, self.noise_sigma)
             x_fake = self.discriminatorNoise(x_fake, self.noise_sigma)
 
-        # run discriminator
+        # run discriminator, the losses are computed in float32 also
+        # under bfloat16 autocast
         if eg:
-            class_fake = discriminator(x_fake)
+            class_fake = discriminator(x_fake).float()
             class_fake = class_fake.squeeze(0)
             # calculate non-saturating loss for g (see Goodfellow 2014)
             loss_g = self.adv_loss_criterion(class_fake, g_ones)
             return loss_g
 
         else:
-            class_fake = discriminator(x_fake.detach())
-            class_real = discriminator(x_real.detach())
+            class_fake = discriminator(x_fake.detach()).float()
+            class_real = discriminator(x_real.detach()).float()
             class_fake = class_fake.squeeze(0)
             class_real = class_real.squeeze(0)
             # calculate adversarial loss for d
@@ -173,6 +176,82 @@ class StyleTransfer(BaseModel):
                 self.adv_loss_criterion(class_fake, zeros)
             return loss_d
 
+    def _padForDiscriminator(self, xs):
+        """
+        Pad the discriminator inputs xs with zeros. With dynamic_max_len
+        they are padded to a common length, so that the length of the
+        generated sequences does not reveal them; otherwise only the ones
+        shorter than the largest kernel are padded, to its size.
+        """
+        kernelSize = max(self.params.discriminator.kernel_sizes, default=1)
+        if self.params.dynamic_max_len:
+            seqLen = max(kernelSize, *[x.shape[1] for x in xs])
+            return [padSequence(x, seqLen) for x in xs]
+        return [
+            padSequence(x, kernelSize) if x.shape[1] < kernelSize else x
+            for x in xs]
+
+    def _realTargets(self, size):
+        d_ones = torch.ones((size, 1), device=execution.device)
+        if self.params.discriminator.l_smoothing:
+            d_ones = labelSmoothing(
+                d_ones, self.params.discriminator.l_smoothing)
+        if self.params.discriminator.l_flipping:
+            d_ones = labelFlipping(
+                d_ones, self.params.discriminator.l_flipping)
+        return d_ones
+
+    def adversarialLosses(self, xs_real, xs_fake, eg, noisy=True):
+        """
+        The losses of adversarialLoss for every style, computed with a single
+        call of the DiscriminatorBank.
+        Args:
+        xs_real, xs_fake -- for each style label, the real and fake inputs
+                            of its discriminator
+        Output:
+        the list of the losses of each style
+        """
+        # the real and fake inputs share the convolutions, so they are
+        # always padded to the same length
+        seqLen = max(
+            *[x.shape[1] for x in xs_real + xs_fake],
+            *self.params.discriminator.kernel_sizes)
+        # the real and fake inputs of each style are evaluated together,
+        # then the styles are stacked and padded to the same batch size
+        if eg:
+            inputs = [padSequence(x, seqLen) for x in xs_fake]
+        else:
+            inputs = [
+                torch.cat((
+                    padSequence(x_real, seqLen),
+                    padSequence(x_fake, seqLen))).detach()
+                for x_real, x_fake in zip(xs_real, xs_fake)]
+        batchSize = max(len(x) for x in inputs)
+
+        x = torch.stack([
+            nn.functional.pad(x, (0, 0, 0, 0, 0, batchSize - len(x)))
+            for x in inputs])
+        if noisy:
+            x = self.discriminatorNoise(x, self.noise_sigma)
+        logits = self.discriminators(x).float()
+
+        losses = []
+        for label, (x_real, x_fake) in enumerate(zip(xs_real, xs_fake)):
+            if eg:
+                # non-saturating loss for g (see Goodfellow 2014)
+                g_ones = torch.ones((len(x_fake), 1), device=execution.device)
+                losses.append(self.adv_loss_criterion(
+                    logits[label, :len(x_fake)], g_ones))
+                continue
+            class_real = logits[label, :len(x_real)]
+            class_fake = logits[label, len(x_real):len(inputs[label])]
+            zeros = torch.zeros((len(x_fake), 1), device=execution.device)
+            losses.append(
+                self.adv_loss_criterion(
+                    class_real, self._realTargets(len(x_real))) +
+                self.adv_loss_criterion(class_fake, zeros))
+        return losses
+
     def _generateWithPrevOutput(
             self, h0, max_len, lengths=[], evaluation=False, soft=True):
         """
@@ -183,65 +262,134 @@ class StyleTransfer(BaseModel):
         h0 -- the first hidden state y + z of size (1, 1, hidden_size)
         max_len -- stops the generator after max_len tokens generated
         Output:
-        hiddens -- of shape (max_len, 1, hidden_size).
-                    If length<max_len it ends with zeros.
+        hiddens -- of shape (batch_size, max_len + 1, hidden_size),
+                   starting with h0
+        tokens -- the soft tokens (batch_size, max_len, embedding_size) if
+                  soft=True, else the ids of the words (batch_size, max_len)
         """
 
         hidden = h0
-        hiddens = torch.zeros(
-            self.size, max_len, self.params.autoencoder.hidden_size,
-            device="cuda")
-        if soft:
-            tokens = torch.zeros(
-                self.size, max_len, self.params.embedding_size, device="cuda")
-        else:
-            tokens = torch.zeros(self.size, max_len, device="cuda")
+        batchSize = h0.shape[1]
+        # the outputs of each step are stacked once at the end, so that
+        # they are allocated on h0's device once per batch
+        hiddens = [h0[-1].unsqueeze(1)]
+        tokens = []
 
         goEmbedding = self.vocabulary(['<go>']).squeeze(0)
-        goEmbedding = goEmbedding.repeat(self.size, 1)
+        goEmbedding = goEmbedding.repeat(batchSize, 1)
+        if self.params.decode_loop and \
+                not isinstance(self.hiddenToVocab, AdaptiveHiddenToVocab):
+            return self._compiledGeneration(
+                h0, goEmbedding, max_len, soft)
+
         goEmbedding = goEmbedding.unsqueeze(1)
         currTokens = goEmbedding
         softSampleFunction = SoftSampleWord(
             dropout=self.params.dropout,
             embeddings=self.vocabulary.embeddings,
-            gamma=self.params.temperature)
+            gamma=self.params.temperature,
+            topK=self.params.gumbel_top_k)
 
         if soft:
-            for index in range(max_len):
-                # generator need input (seq_len, batch_size, input_size)
-                output, hidden = self.generator(
-                    currTokens, hidden, pad=False)
-                currTokens, vocabLogits = softSampleFunction(
-                    output=output,
-                    hiddenToVocab=self.hiddenToVocab)
-                tokens[:, index, :] = currTokens
-                currTokens = currTokens.unsqueeze(1)
-                hiddens[:, index, :] = hidden
+            # with activation checkpointing the steps are run in segments,
+            # whose activations are recomputed during backward
+            segment = self.params.checkpoint_steps or max_len
+            for start in range(0, max_len, segment):
+                currTokens, hidden, segmentTokens, segmentHiddens = \
+                    self._checkpoint(
+                        self._softSamplingSteps, currTokens, hidden,
+                        min(segment, max_len - start), softSampleFunction)
+                tokens.append(segmentTokens)
+                hiddens.append(segmentHiddens)
 
         else:
             for index in range(max_len):
                 output, hidden = self.generator(currTokens, hidden, pad=False)
-                vocabLogit = self.hiddenToVocab(hidden)
-                idxs = vocabLogit[0, :, :].max(1)[1]
-                tokens[:, index] = idxs
+                idxs = self._mostProbableWords(hidden[-1])
+                tokens.append(idxs.unsqueeze(1))
                 currTokens = self.vocabulary(idxs, byWord=False).unsqueeze(1)
+                hiddens.append(hidden[-1].unsqueeze(1))
+
+        return torch.cat(hiddens, dim=1), torch.cat(tokens, dim=1)
+
+    def _softSamplingSteps(
+            self, currTokens, hidden, steps, softSampleFunction):
+        """
+        Run steps steps of the soft professor forcing from the tokens
+        currTokens (batch_size, 1, embedding_size) and the hidden state hidden
+        Output:
+        currTokens, hidden -- the inputs of the next step
+        tokens -- the soft tokens (batch_size, steps, embedding_size)
+        hiddens -- (batch_size, steps, hidden_size)
+        """
+        tokens = []
+        hiddens = []
+        for index in range(steps):
+            # generator need input (seq_len, batch_size, input_size)
+            output, hidden = self.generator(
+                currTokens, hidden, pad=False)
+            currTokens, vocabLogits = softSampleFunction(
+                output=output,
+                hiddenToVocab=self.hiddenToVocab)
+            tokens.append(currTokens)
+            currTokens = currTokens.unsqueeze(1)
+            hiddens.append(hidden[-1])
+        return currTokens, hidden, torch.stack(tokens, 1), \
+            torch.stack(hiddens, 1)
+
+    def _checkpoint(self, function, *args):
+        """
+        Run function(*args), recomputing it during backward instead of
+        keeping its activations if params.checkpoint_steps > 0
+        """
+        if self.params.checkpoint_steps > 0 and torch.is_grad_enabled():
+            return checkpoint(function, *args, use_reentrant=False)
+        return function(*args)
 
-        hiddens = torch.cat((h0.transpose(0, 1), hiddens), dim=1)
-        return hiddens, tokens
+    def _compiledGeneration(self, h0, goEmbedding, max_len, soft):
+        """
+        Same generation of _generateWithPrevOutput, running the compiled
+        professorForcingLoop selected by params.decode_loop
+        """
+        loop = compiledProfessorForcingLoop(self.params.decode_loop)
+        gruWeights = [
+            weight for layer in self.generator.cell.all_weights
+            for weight in layer]
+        return loop(
+            h0, goEmbedding, gruWeights, self.hiddenToVocab.weight,
+            self.hiddenToVocab.bias, self.vocabulary.embeddings.weight,
+            max_len, soft, self.generator.dropoutLayer.p,
+            self.params.dropout, self.params.temperature,
+            self.generator.training, self.params.gumbel_top_k)
+
+    def _mostProbableWords(self, hidden):
+        if isinstance(self.hiddenToVocab, AdaptiveHiddenToVocab):
+            return self.hiddenToVocab.predict(hidden)
+        return self.hiddenToVocab(hidden).max(1)[1]
 
     def _generateTokens(self, tokens, h0, lenghts, evaluation):
         hidden = h0
-        generatedVocabs = torch.zeros(
-            self.size, len(tokens), self.vocabulary.vocabSize + 1,
-            device=device)
-        output, hidden = self.generator(tokens, hidden, lenghts)
+        output, hidden = self._checkpoint(
+            self.generator, tokens, hidden, lenghts)
 
         # dropping some values of the generator output
         # during both training and test
         output = self.dropoutLayer(output)
-
-        generatedVocabs = self.hiddenToVocab(output)
-        return generatedVocabs, output
+        return output
+
+    def _reconstructionLoss(self, output, targets, lenghts):
+        # re-pack padded sequence for computing losses,
+        # so that the padding is never projected to the vocabulary
+        packedOutput = nn.utils.rnn.pack_padded_sequence(
+            output, lenghts, batch_first=True, enforce_sorted=False)[0]
+        if isinstance(self.hiddenToVocab, AdaptiveHiddenToVocab):
+            # the adaptive softmax computes its loss in float32
+            with torch.autocast(
+                    device_type=execution.device.type, enabled=False):
+                return self.hiddenToVocab.loss(
+                    packedOutput.float(), targets[0])
+        return self.rec_loss_criterion(
+            self.hiddenToVocab(packedOutput).float(), targets[0])
 
     def _computeHiddens(
             self, encoder_inputs, generator_input, labels, lenghts, evaluation):
@@ -251,11 +399,12 @@ class StyleTransfer(BaseModel):
         else:
             size = self.params.batch_size
 
-        tensorLabels = torch.FloatTensor(labels).to(device)
+        tensorLabels = torch.FloatTensor(labels).to(execution.device)
         tensorLabels = tensorLabels.unsqueeze(1)
         initialHiddens = self.encoderLabelsTransform(tensorLabels)
         initialHiddens = initialHiddens.unsqueeze(0)
-        zeros = torch.zeros(1, size, self.params.dim_z, device=device)
+        zeros = torch.zeros(
+            1, size, self.params.dim_z, device=execution.device)
         initialHiddens = torch.cat((initialHiddens, zeros), dim=2)
         _, content = self.encoder(encoder_inputs, initialHiddens, lenghts)
         content = content[:, :, self.params.dim_y:]
@@ -278,66 +427,92 @@ class StyleTransfer(BaseModel):
         """
         which_params - string 'd0' or 'd1' or 'eg'
         """
-
+        h_teacher, h_professor = self._forwardBatch(
+            encoder_inputs, generator_input, labels, lenghts, evaluation)
+        self._computeLosses(
+            h_teacher, h_professor, targets, labels, lenghts, evaluation,
+            which_params)
+
+    def _forwardBatch(
+            self, encoder_inputs, generator_input, labels, lenghts,
+            evaluation):
+        """
+        Run the encoder and the generator, returning the hidden states
+        of the teacher forced and of the professor forced generation
+        """
         self.size = self.eval_size if evaluation else self.params.batch_size
         self.losses = defaultdict(float)
-        negativeIndex = np.where(labels == 0)[0]
-        positiveIndex = np.nonzero(labels)
 
         self._computeHiddens(
                 encoder_inputs, generator_input, labels, lenghts, evaluation)
 
         # teacher forced generation
-        generatorOutputs, h_teacher = self._generateTokens(
+        h_teacher = self._generateTokens(
             generator_input, self.originalHiddens, lenghts, evaluation)
 
         # professor forced generation
         h_professor, _ = self._generateWithPrevOutput(
-            self.transformedHiddens, self.params.max_len,
+            self.transformedHiddens, self._professorLength(lenghts),
             lenghts, evaluation, soft=True)
+        return h_teacher, h_professor
+
+    def _professorLength(self, lenghts):
+        """
+        Number of soft tokens generated for the transformed sentences
+        """
+        if not self.params.dynamic_max_len:
+            return self.params.max_len
+        # the longest sentence of the batch, <eos> included, plus the slack
+        return min(
+            self.params.max_len,
+            int(max(lenghts)) + self.params.max_len_slack)
+
+    def _computeLosses(
+            self, h_teacher, h_professor, targets, labels, lenghts,
+            evaluation, which_params):
+        """
+        which_params - string 'd0' or 'd1' or 'eg', or a tuple of them
+        """
+        negativeIndex = np.where(labels == 0)[0]
+        positiveIndex = np.nonzero(labels)
+        # the discriminator of each style gets the hidden states of the
+        # sentences of its style as real, and the transferred ones as fake
+        reals = [h_teacher[negativeIndex], h_teacher[positiveIndex]]
+        fakes = [h_professor[positiveIndex], h_professor[negativeIndex]]
+        batched = self.params.discriminator.batched
 
         # econder and generator's reconstruction loss
-        if which_params == 'eg':
-            # re-pack padded sequence for computing losses
-            packedGenOutput = nn.utils.rnn.pack_padded_sequence(
-                generatorOutputs, lenghts, batch_first=True)[0]
-
-            self.losses['reconstruction'] = self.rec_loss_criterion(
-                packedGenOutput.view(-1, self.vocabulary.vocabSize),
-                targets[0].view(-1))
-
-            g_loss = self.adversarialLoss(
-                h_teacher[negativeIndex],
-                h_professor[positiveIndex],
-                label=0, eg=True,
-                noisy=not evaluation)
-            self.losses['generator'] += g_loss
-
-            g_loss = self.adversarialLoss(
-                h_teacher[positiveIndex],
-                h_professor[negativeIndex],
-                label=1, eg=True,
-                noisy=not evaluation)
-            self.losses['generator'] += g_loss
-
-        # train D_0 with negative sentences
-        if which_params == 'd0':
-            d0_loss = self.adversarialLoss(
-                h_teacher[negativeIndex],
-                h_professor[positiveIndex],
-                label=0, eg=False,
-                noisy=not evaluation)
-            self.losses['discriminator0'] = d0_loss
-
-
-        # train D_1 with positive sentences
-        if which_params == 'd1':
-            d1_loss = self.adversarialLoss(
-                h_teacher[positiveIndex],
-                h_professor[negativeIndex],
-                label=1, eg=False,
-                noisy=not evaluation)
-            self.losses['discriminator1'] = d1_loss
+        if 'eg' in which_params:
+            self.losses['reconstruction'] = self._reconstructionLoss(
+                h_teacher, targets, lenghts)
+
+            if batched:
+                g_losses = self.adversarialLosses(
+                    reals, fakes, eg=True, noisy=not evaluation)
+            else:
+                g_losses = [
+                    self.adversarialLoss(
+                        reals[label], fakes[label], label=label, eg=True,
+                        noisy=not evaluation)
+                    for label in range(len(reals))]
+            for g_loss in g_losses:
+                self.losses['generator'] += g_loss
+
+        # train D_0 with negative sentences and D_1 with positive sentences
+        labelsToTrain = [
+            label for label in range(len(reals))
+            if 'd{0}'.format(label) in which_params]
+        if batched and len(labelsToTrain) == len(reals):
+            d_losses = self.adversarialLosses(
+                reals, fakes, eg=False, noisy=not evaluation)
+        else:
+            d_losses = [
+                self.adversarialLoss(
+                    reals[label], fakes[label], label=label, eg=False,
+                    noisy=not evaluation)
+                for label in labelsToTrain]
+        for label, d_loss in zip(labelsToTrain, d_losses):
+            self.losses['discriminator{0}'.format(label)] = d_loss
 
     def _zeroGradients(self):
         self.autoencoder_optimizer.zero_grad()
@@ -345,20 +520,21 @@ class StyleTransfer(BaseModel):
         self.discriminator1_optimizer.zero_grad()
 
     def _sentencesToInputs(self, sentences, noisy):
-        # transform sentences into embeddings
-        sentences = list(map(lambda x: x.split(" "), sentences))
-        encoder_inputs, generator_inputs, targets, lengths = \
-            preprocessSentences(
-                sentences, noisy=noisy,
-                word_drop=self.params.autoencoder.word_drop)
-        encoder_inputs = torch.autograd.Variable(torch.stack(list(map(
-            self.vocabulary, encoder_inputs))))
-        generator_inputs = torch.autograd.Variable(torch.stack(list(map(
-            self.vocabulary, generator_inputs))))
-        targets = torch.autograd.Variable(torch.stack(list(map(
-            self.vocabulary.getSentenceIds, targets))))
+        # transform sentences into one padded tensor of ids, whose shifted
+        # views are the encoder inputs, the generator inputs and the targets
+        if isinstance(sentences, IdBatch):
+            # already prepared, e.g. by a BatchPrefetcher
+            ids, lengths = sentences
+        else:
+            ids, lengths = map(torch.from_numpy, batchToIds(
+                sentences, self.vocabulary.word2id, noisy=noisy,
+                word_drop=self.params.autoencoder.word_drop))
+        ids = ids.to(execution.device)
+        embeddings = self.vocabulary(ids, byWord=False)
+        encoder_inputs = embeddings[:, 1:]
+        generator_inputs = embeddings[:, :-1]
         targets = nn.utils.rnn.pack_padded_sequence(
-            targets, lengths, batch_first=True)
+            ids[:, 1:], lengths, batch_first=True, enforce_sorted=False)
 
         return encoder_inputs, generator_inputs, targets, lengths
 
@@ -368,12 +544,17 @@ class StyleTransfer(BaseModel):
         encoder_inputs, generator_inputs, targets, lenghts = \
             self._sentencesToInputs(
                 sentences, noisy=True)
+        if self.params.shared_forward:
+            return self._trainOnBatchSharedForward(
+                encoder_inputs, generator_inputs, targets, labels, lenghts,
+                iterNum)
 
         # compute losses for discriminator0 and optimize
         self._zeroGradients()
-        self._runBatch(
-            encoder_inputs, generator_inputs, targets, labels, lenghts,
-            evaluation=False, which_params='d0')
+        with autocast(self.params):
+            self._runBatch(
+                encoder_inputs, generator_inputs, targets, labels, lenghts,
+                evaluation=False, which_params='d0')
 
         d0Loss = self.losses['discriminator0']
         self.losses['discriminator0'].backward()
@@ -381,9 +562,10 @@ class StyleTransfer(BaseModel):
 
         # compute losses for discriminator1 and optimize
         self._zeroGradients()
-        self._runBatch(
-            encoder_inputs, generator_inputs, targets, labels, lenghts,
-            evaluation=False, which_params='d1')
+        with autocast(self.params):
+            self._runBatch(
+                encoder_inputs, generator_inputs, targets, labels, lenghts,
+                evaluation=False, which_params='d1')
 
         d1Loss = self.losses['discriminator1']
         self.losses['discriminator1'].backward()
@@ -391,9 +573,49 @@ class StyleTransfer(BaseModel):
 
         # compute losses for encoder and generator and optimize
         self._zeroGradients()
-        self._runBatch(
-            encoder_inputs, generator_inputs, targets, labels, lenghts,
-            evaluation=False, which_params='eg')
+        with autocast(self.params):
+            self._runBatch(
+                encoder_inputs, generator_inputs, targets, labels, lenghts,
+                evaluation=False, which_params='eg')
+        return self._optimizeAutoencoder(d0Loss, d1Loss, iterNum)
+
+    def _trainOnBatchSharedForward(
+            self, encoder_inputs, generator_inputs, targets, labels, lenghts,
+            iterNum):
+        """
+        Same updates of trainOnBatch, running the encoder and the generator
+        only once: the discriminators are trained on the detached hidden
+        states, then the graph is reused for the encoder and generator loss
+        """
+        self._zeroGradients()
+        with autocast(self.params):
+            h_teacher, h_professor = self._forwardBatch(
+                encoder_inputs, generator_inputs, labels, lenghts,
+                evaluation=False)
+
+            # compute losses for both discriminators and optimize,
+            # their inputs are detached so gradients only reach their own
+            # parameters
+            self._computeLosses(
+                h_teacher, h_professor, targets, labels, lenghts,
+                evaluation=False, which_params=('d0', 'd1'))
+        d0Loss = self.losses['discriminator0']
+        d1Loss = self.losses['discriminator1']
+        (d0Loss + d1Loss).backward()
+        self.discriminator0_optimizer.step()
+        self.discriminator1_optimizer.step()
+
+        # compute losses for encoder and generator with the updated
+        # discriminators and optimize
+        self._zeroGradients()
+        self.losses = defaultdict(float)
+        with autocast(self.params):
+            self._computeLosses(
+                h_teacher, h_professor, targets, labels, lenghts,
+                evaluation=False, which_params='eg')
+        return self._optimizeAutoencoder(d0Loss, d1Loss, iterNum)
+
+    def _optimizeAutoencoder(self, d0Loss, d1Loss, iterNum):
         self.losses['autoencoder'] = self.losses['reconstruction'].clone()
         if d1Loss < self.params.max_d_loss and \
                 d0Loss < self.params.max_d_loss:
@@ -405,7 +627,7 @@ class StyleTransfer(BaseModel):
             self.losses['discriminator0'] = d0Loss
             self.printDebugLoss()
 
-        self.losses['autoencoder'].backward(retain_graph=True)
+        self.losses['autoencoder'].backward()
         # clip the gradients
         torch.nn.utils.clip_grad_norm_(
             [*self.encoder.parameters(), *self.generator.parameters(),
@@ -419,70 +641,111 @@ class StyleTransfer(BaseModel):
         self.noise_sigma = self.noise_sigma * self.params.noise_decay
         return self.losses['autoencoder']
 
+    def load(self, fileName):
+        checkpoint = torch.load(fileName, map_location=execution.device)
+        if not any(k.startswith('discriminators.') for k in checkpoint):
+            # saved when the discriminators were not submodules,
+            # they keep their initial weights
+            checkpoint.update({
+                'discriminators.' + k: v
+                for k, v in self.discriminators.state_dict().items()})
+        self.load_state_dict(checkpoint)
+
+    def trainingState(self, trainBatches):
+        state = super().trainingState(trainBatches)
+        state['noise_sigma'] = self.noise_sigma
+        return state
+
+    def loadTrainingState(self, state, trainBatches):
+        super().loadTrainingState(state, trainBatches)
+        self.noise_sigma = state['noise_sigma']
+
     def evaluateOnBatch(self, sentences, labels):
         self.eval()
-        self.eval_size = len(sentences)
+        self.eval_size = len(labels)
         encoder_inputs, generator_inputs, targets, lengths = \
             self._sentencesToInputs(sentences, noisy=False)
 
         labels = np.array(labels)
-        self._runBatch(
-            encoder_inputs, generator_inputs, targets, labels, lengths,
-            evaluation=True, which_params='eg')
+        with autocast(self.params):
+            self._runBatch(
+                encoder_inputs, generator_inputs, targets, labels, lengths,
+                evaluation=True, which_params='eg')
 
         self.losses['autoencoder'] = self.losses['reconstruction'] + \
             self.params.lambda_GAN * self.losses['generator']
 
         return self.losses['autoencoder']
 
+    def evaluateLosses(self, batches):
+        """
+        Losses of each batch, without building the autograd graph
+        Args:
+        batches -- an EvaluationSet or a list of (sentences, labels)
+        Output:
+        a dict loss name -> tensor of the losses of the batches
+        """
+        batchLosses = defaultdict(list)
+        with torch.inference_mode():
+            for sentences, labels in batches:
+                self.evaluateOnBatch(sentences, labels)
+                # kept on the device, read all at once at the end
+                for k, v in self.losses.items():
+                    batchLosses[k].append(torch.as_tensor(v).float())
+        return {k: torch.stack(v).cpu() for k, v in batchLosses.items()}
+
     def evaluate(self, batches, epoch_index):
-        batchLosses = []
-        self.losses = defaultdict(float)
-        for batch in batches:
-            sentences = batch[0]
-            labels = batch[1]
-            self.evaluateOnBatch(sentences, labels)
-            batchLosses.append(
-                {k: copy.deepcopy(float(v)) for k, v in self.losses.items()})
-
-        if self.params.logdir:
-            greedy = GreedyDecoder(self, self.params)
-            beam = BeamSearchDecoder(self, self.params)
-            epoch_dir = os.path.join(
-                self.params.logdir, 'epoch_{0}'.format(epoch_index))
-            os.makedirs(epoch_dir, exist_ok=True)
-            lossFile = os.path.join(epoch_dir, 'losses.pickle')
-            transferFile = os.path.join(epoch_dir, 'transfers.json')
-            with open(lossFile, 'wb') as fp:
-                pickle.dump(batchLosses, fp)
-
-            inputs, labels = batches[0]
-            rGreedy, tGreedy = greedy.rewriteBatch(inputs, labels)
-            rBeam, tBeam = beam.rewriteBatch(inputs, labels)
-
-            encoder_inputs, generator_inputs, targets, lenghts = \
-                self._sentencesToInputs(inputs, noisy=False)
-            self._computeHiddens(
-                    encoder_inputs, generator_inputs, labels, lenghts, True)
-            reconstructed, _ = self._generateTokens(
-                generator_inputs, self.originalHiddens, lenghts, True)
-            reconstructedIds = reconstructed.max(2)[1]
-            reconstructedSents = []
-            for i in range(reconstructedIds.shape[0]):
-                ids = reconstructedIds[i, :]
-                reconstructedSents.append(
-                    " ".join([self.vocabulary.id2word[x] for x in ids]))
-
-            with open(transferFile, 'w') as fp:
-                json.dump(
-                    {'labels': batch[1],
-                     'reconstructed': reconstructedSents,
-                     'reconstructed_greedy': rGreedy,
-                     'transformed_greedy': tGreedy,
-                     'reconstructed_beam': rBeam,
-                     'transformed_beam': tBeam}, fp)
-
-        return np.average([float(x['autoencoder']) for x in batchLosses])
+        if not isinstance(batches, EvaluationSet):
+            batches = EvaluationSet(batches, self.vocabulary.word2id)
+        with torch.inference_mode():
+            losses = self.evaluateLosses(batches)
+            if self.params.logdir:
+                self._logEvaluation(batches, losses, epoch_index)
+        return float(losses['autoencoder'].mean())
+
+    def _logEvaluation(self, batches, losses, epoch_index):
+        """
+        Write the losses of the batches and the transfers of the first one
+        to the logdir of the epoch
+        """
+        greedy = GreedyDecoder(self, self.params)
+        beam = BeamSearchDecoder(self, self.params)
+        epoch_dir = os.path.join(
+            self.params.logdir, 'epoch_{0}'.format(epoch_index))
+        os.makedirs(epoch_dir, exist_ok=True)
+        lossFile = os.path.join(epoch_dir, 'losses.pickle')
+        transferFile = os.path.join(epoch_dir, 'transfers.json')
+        batchLosses = [
+            dict(zip(losses, x))
+            for x in zip(*(v.tolist() for v in losses.values()))]
+        with open(lossFile, 'wb') as fp:
+            pickle.dump(batchLosses, fp)
+
+        inputs, labels = batches[0]
+        rGreedy, tGreedy = greedy.rewriteBatch(inputs, labels)
+        rBeam, tBeam = beam.rewriteBatch(inputs, labels)
+
+        encoder_inputs, generator_inputs, targets, lenghts = \
+            self._sentencesToInputs(inputs, noisy=False)
+        self._computeHiddens(
+                encoder_inputs, generator_inputs, labels, lenghts, True)
+        reconstructed = self._generateTokens(
+            generator_inputs, self.originalHiddens, lenghts, True)
+        reconstructedIds = self.hiddenToVocab(reconstructed).max(2)[1]
+        reconstructedSents = []
+        for i in range(reconstructedIds.shape[0]):
+            ids = reconstructedIds[i, :]
+            reconstructedSents.append(
+                " ".join([self.vocabulary.id2word[x] for x in ids]))
+
+        with open(transferFile, 'w') as fp:
+            json.dump(
+                {'labels': labels,
+                 'reconstructed': reconstructedSents,
+                 'reconstructed_greedy': rGreedy,
+                 'transformed_greedy': tGreedy,
+                 'reconstructed_beam': rBeam,
+                 'transformed_beam': tBeam}, fp)
 
     def transformBatch(self, sentences, labels):
         self.eval()
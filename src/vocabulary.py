@@ -1,15 +1,84 @@
 """
 Keep the current vocabulary and embeddings
+
+Vocabularies are stored in a versioned binary format, little-endian:
+header -- magic b'STVOCAB' and a null byte, uint32 version, uint32 reserved,
+          uint64 number of words n, uint64 size of the words blob
+offsets -- (n + 1) uint64 offsets of each word in the blob
+counts -- n uint64 frequencies of the words
+blob -- the UTF-8 encoded words, concatenated
+The file is memory-mapped, so processes loading the same vocabulary share
+its pages. Vocabularies saved as a pickled list of words are still loaded.
 """
 import logging
+import mmap
+import operator
 import pickle
+import struct
+import numpy as np
 import torch
 from torch import nn
+from src import execution
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 _SPECIAL_TOKENS = ['<pad>', '<go>', '<eos>', '<unk>']
 
+_MAGIC = b'STVOCAB\0'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIQQ')
+
+
+def saveVocabulary(fileName, words, counts=None):
+    """
+    Save the words (special tokens excluded) with their counts
+    in the binary vocabulary format
+    """
+    encoded = [x.encode('utf-8') for x in words]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(x) for x in encoded])
+    if counts is None:
+        counts = np.zeros(len(encoded))
+    counts = np.asarray(counts, dtype='<u8')
+    with open(fileName, 'wb') as fp:
+        fp.write(_HEADER.pack(
+            _MAGIC, _VERSION, 0, len(encoded), int(offsets[-1])))
+        fp.write(offsets.tobytes())
+        fp.write(counts.tobytes())
+        fp.write(b''.join(encoded))
+
+
+class _MappedWords(object):
+    """
+    Read-only list of words: the special tokens followed by the words of a
+    memory-mapped vocabulary, decoded when accessed
+    """
+
+    def __init__(self, specialTokens, blob, offsets):
+        self.specialTokens = specialTokens
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.specialTokens) + len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = operator.index(index)
+        if index < 0:
+            index += len(self)
+        if index < len(self.specialTokens):
+            return self.specialTokens[index]
+        index -= len(self.specialTokens)
+        if index >= len(self.offsets) - 1:
+            raise IndexError('word id out of range')
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return str(self.blob[start:end], 'utf-8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
 
 class Vocabulary(nn.Module):
 
@@ -17,35 +86,76 @@ class Vocabulary(nn.Module):
         "vocabulary is a list of all the words we are interested into"
         super().__init__()
         self.embeddings = None
-        self.word2id = None
+        self.id2word = None
+        self.counts = None
+        self._word2id = None
+
+    @property
+    def word2id(self):
+        # the mapping is built only when needed
+        if self._word2id is None and self.id2word is not None:
+            self._word2id = {x: i for i, x in enumerate(self.id2word)}
+        return self._word2id
 
     def loadVocabulary(self, fileName):
+        with open(fileName, 'rb') as fp:
+            magic = fp.read(len(_MAGIC))
+        if magic == _MAGIC:
+            self._loadMappedVocabulary(fileName)
+            return
+
         with open(fileName, 'rb') as fp:
             vocabulary = pickle.load(fp)
+        # every instance gets its own copy of the special tokens
+        self.id2word = list(_SPECIAL_TOKENS) + list(vocabulary)
+        self.counts = None
+        self._word2id = None
+        self.vocabSize = len(self.id2word)
 
-        self.word2id = dict(zip(
-            _SPECIAL_TOKENS, range(len(_SPECIAL_TOKENS))))
-        self.id2word = _SPECIAL_TOKENS
-        numSpecial = len(_SPECIAL_TOKENS)
-        for wordId, word in enumerate(vocabulary):
-            currId = wordId + numSpecial
-            self.word2id[word] = currId
-            self.id2word.append(word)
+    def _loadMappedVocabulary(self, fileName):
+        with open(fileName, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        _, version, _, numWords, blobSize = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(
+                'Unsupported vocabulary version {0} in {1}'.format(
+                    version, fileName))
+        position = _HEADER.size
+        offsets = np.frombuffer(
+            data, dtype='<u8', count=numWords + 1, offset=position)
+        position += offsets.nbytes
+        self.counts = np.frombuffer(
+            data, dtype='<u8', count=numWords, offset=position)
+        position += self.counts.nbytes
+        blob = memoryview(data)[position:position + blobSize]
+        self.id2word = _MappedWords(list(_SPECIAL_TOKENS), blob, offsets)
+        self._word2id = None
         self.vocabSize = len(self.id2word)
 
     def initializeEmbeddings(self, embeddingSize):
         self.embeddingSize = embeddingSize
-        if self.word2id is None:
+        if self.id2word is None:
             logging.error('Load vocabulary first')
             return
 
         self.embeddings = torch.nn.Embedding(
-            self.vocabSize, self.embeddingSize).to(device)
+            self.vocabSize, self.embeddingSize).to(execution.device)
 
     def getSentenceIds(self, words):
         unkId = self.word2id['<unk>']
         ids = list(map(lambda x: self.word2id.get(x, unkId), words))
-        return torch.LongTensor(ids).to(device)
+        return torch.LongTensor(ids).to(execution.device)
+
+    def idsToSentences(self, ids, lengths):
+        """
+        Join the first lengths[i] words of each row of ids
+        Args:
+        ids -- (batch_size, seq_len) tensor of word ids
+        lengths -- (batch_size) tensor of the number of words to keep
+        """
+        return [
+            " ".join(self.id2word[x] for x in sentence[:length])
+            for sentence, length in zip(ids.tolist(), lengths.tolist())]
 
     def getEmbedding(self, words, byWord):
         if byWord:
@@ -0,0 +1,70 @@
+import types
+import numpy as np
+import pytest
+import torch
+from src.checkpointing import CheckpointWriter
+from src.corpus import CompiledBatches, CompiledCorpus, compileCorpus
+from src.generate_batches import BucketedBatches
+
+STYLES = [
+    ["a b", "b c d", "a", "c c c a", "d a b", "b", "a d", "c b a d"],
+    ["d d", "a", "b c", "c a d b a", "b b", "a c d", "d", "c a"]]
+
+
+@pytest.fixture
+def corpora(tmp_path):
+    vocabulary = types.SimpleNamespace(word2id={
+        '<unk>': 0, 'a': 1, 'b': 2, 'c': 3, 'd': 4})
+    prefixes = []
+    for index, lines in enumerate(STYLES):
+        fileName = str(tmp_path / 'style{0}.txt'.format(index))
+        with open(fileName, 'w') as fp:
+            fp.write("\n".join(lines) + "\n")
+        prefix = str(tmp_path / 'style{0}'.format(index))
+        compileCorpus(fileName, vocabulary, prefix)
+        prefixes.append(prefix)
+    return lambda: [CompiledCorpus(prefix) for prefix in prefixes]
+
+
+def epochs(batches, count):
+    result = []
+    for _ in range(count):
+        batches.shuffle()
+        result.append([
+            [x.tolist() for x in inputs] + labels for inputs, labels in (
+                batches[i] for i in range(len(batches)))])
+    return result
+
+
+@pytest.mark.parametrize("makeBatches", [
+    lambda corpora: CompiledBatches(corpora, 4, seed=0),
+    lambda corpora: BucketedBatches(corpora, 4, bucketSize=2, seed=0)])
+def test_resumeFromEpochEnd(corpora, tmp_path, makeBatches):
+    fileName = str(tmp_path / 'batches.state')
+    expected = epochs(makeBatches(corpora()), 3)
+
+    batches = makeBatches(corpora())
+    epochs(batches, 1)
+    writer = CheckpointWriter()
+    writer.save(batches.state_dict(), fileName)
+    # the next epoch starts while the state is being written
+    batches.shuffle()
+    writer.wait()
+
+    resumed = makeBatches(corpora())
+    resumed.load_state_dict(torch.load(fileName, weights_only=False))
+    assert epochs(resumed, 2) == expected[1:]
+
+
+def test_saveAllWritesEveryCheckpoint(tmp_path):
+    order = np.arange(6)
+    writer = CheckpointWriter()
+    writer.saveAll([
+        ({'order': order}, str(tmp_path / 'first')),
+        ({'weight': torch.ones(2)}, str(tmp_path / 'second'))])
+    order[:] = 0
+    writer.wait()
+    first = torch.load(str(tmp_path / 'first'), weights_only=False)
+    second = torch.load(str(tmp_path / 'second'), weights_only=False)
+    assert first['order'].tolist() == list(range(6))
+    assert second['weight'].tolist() == [1.0, 1.0]
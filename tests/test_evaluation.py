@@ -0,0 +1,14 @@
+from src.evaluation import EvaluationSet
+
+WORD2ID = {'<pad>': 0, '<go>': 1, '<eos>': 2, '<unk>': 3, 'a': 4, 'b': 5}
+
+
+def test_subsampleHasEveryStyleInEveryBatch():
+    # a rare second style, fewer sentences than the batches of the sample
+    batches = [(["a b"] * 8, [0] * 8)] * 6 + [(["b", "b a"], [1, 1])]
+    evaluationSet = EvaluationSet(batches, WORD2ID)
+    for size in [5, 20, 50]:
+        sample = evaluationSet.subsample(size, seed=0)
+        assert len(sample) > 0
+        for _, labels in (sample[i] for i in range(len(sample))):
+            assert sorted(set(labels)) == [0, 1]
@@ -0,0 +1,122 @@
+import pickle
+import pytest
+import torch
+from src.parameters_pb2 import StyleTransferParams
+from src.rnn import compiledProfessorForcingLoop, professorForcingLoop
+from src.style_transfer import StyleTransfer
+from src.vocabulary import Vocabulary
+
+BATCH_SIZE = 3
+EMBEDDING_SIZE = 4
+HIDDEN_SIZE = 5
+VOCABULARY_SIZE = 7
+STEPS = 6
+
+
+def loopInputs():
+    torch.manual_seed(0)
+    gru = torch.nn.GRU(EMBEDDING_SIZE, HIDDEN_SIZE)
+    gruWeights = [
+        weight.detach().requires_grad_()
+        for layer in gru.all_weights for weight in layer]
+    outWeight = torch.randn(
+        VOCABULARY_SIZE, HIDDEN_SIZE, requires_grad=True)
+    outBias = torch.randn(VOCABULARY_SIZE, requires_grad=True)
+    embeddings = torch.randn(
+        VOCABULARY_SIZE, EMBEDDING_SIZE, requires_grad=True)
+    h0 = torch.randn(1, BATCH_SIZE, HIDDEN_SIZE, requires_grad=True)
+    goEmbedding = embeddings[0].detach().repeat(BATCH_SIZE, 1)
+    return [h0, goEmbedding, gruWeights, outWeight, outBias, embeddings]
+
+
+def runLoop(loop, soft, topK):
+    inputs = loopInputs()
+    # the same random numbers for every implementation
+    torch.manual_seed(1)
+    hiddens, tokens = loop(
+        *inputs, STEPS, soft, 0.5, 0.5, 0.1, True, topK)
+    outputs = [hiddens.detach(), tokens.detach()]
+    if soft:
+        (hiddens.sum() + tokens.sum()).backward()
+        h0, _, gruWeights, outWeight, outBias, embeddings = inputs
+        outputs.extend(
+            x.grad for x in [h0, outWeight, outBias, embeddings] + gruWeights)
+    return outputs
+
+
+def assertClose(actual, expected):
+    assert len(actual) == len(expected)
+    for x, y in zip(actual, expected):
+        assert x.shape == y.shape
+        assert torch.allclose(x.float(), y.float(), atol=1e-5)
+
+
+@pytest.fixture
+def eagerRandom(monkeypatch):
+    # let torch.compile draw the same random numbers of eager mode
+    monkeypatch.setattr(torch._inductor.config, "fallback_random", True)
+
+
+@pytest.mark.parametrize("backend", ["script", "compile"])
+@pytest.mark.parametrize("soft,topK", [(True, 0), (True, 3), (False, 0)])
+def test_compiledLoopMatchesProfessorForcingLoop(
+        eagerRandom, backend, soft, topK):
+    expected = runLoop(professorForcingLoop, soft, topK)
+    actual = runLoop(compiledProfessorForcingLoop(backend), soft, topK)
+    assertClose(actual, expected)
+
+
+@pytest.fixture
+def model(tmp_path):
+    fileName = str(tmp_path / 'vocabulary.pickle')
+    with open(fileName, 'wb') as fp:
+        pickle.dump(['a', 'b', 'c'], fp)
+    params = StyleTransferParams()
+    params.max_len = STEPS
+    params.embedding_size = EMBEDDING_SIZE
+    params.dim_y = 2
+    params.dim_z = HIDDEN_SIZE - params.dim_y
+    params.temperature = 0.1
+    params.dropout = 0.5
+    params.autoencoder.input_size = EMBEDDING_SIZE
+    params.autoencoder.hidden_size = HIDDEN_SIZE
+    params.autoencoder.num_layers = 1
+    params.autoencoder.dropout = 0.5
+    params.discriminator.in_channels = 1
+    params.discriminator.out_channels = 2
+    params.discriminator.kernel_sizes.extend([1, 2])
+    vocabulary = Vocabulary()
+    vocabulary.loadVocabulary(fileName)
+    torch.manual_seed(0)
+    vocabulary.initializeEmbeddings(EMBEDDING_SIZE)
+    model = StyleTransfer(params, vocabulary)
+    model.train()
+    return model
+
+
+def generate(model, soft):
+    torch.manual_seed(0)
+    h0 = torch.randn(1, BATCH_SIZE, HIDDEN_SIZE)
+    model.zero_grad()
+    # the same random numbers for every implementation
+    torch.manual_seed(1)
+    hiddens, tokens = model._generateWithPrevOutput(h0, STEPS, soft=soft)
+    outputs = [hiddens.detach(), tokens.detach()]
+    if soft:
+        (hiddens.sum() + tokens.sum()).backward()
+        outputs.extend(
+            parameter.grad.clone() for parameter in model.parameters()
+            if parameter.grad is not None)
+    return outputs
+
+
+@pytest.mark.parametrize("backend", ["script", "compile"])
+@pytest.mark.parametrize("soft,topK", [(True, 0), (True, 3), (False, 0)])
+def test_compiledLoopMatchesGenerateWithPrevOutput(
+        eagerRandom, model, backend, soft, topK):
+    model.params.gumbel_top_k = topK
+    model.params.decode_loop = ""
+    expected = generate(model, soft)
+    model.params.decode_loop = backend
+    actual = generate(model, soft)
+    assertClose(actual, expected)